@@ -39,6 +39,40 @@ CREATE TABLE `activitylog` (
   `timestamp` datetime DEFAULT NULL
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
 
+--
+-- Table structure for table `activitylog_archive`
+-- (activities older than the hot window, moved here by the archive job)
+--
+DROP TABLE IF EXISTS `activitylog_archive`;
+
+CREATE TABLE `activitylog_archive` (
+  `id` int(11) NOT NULL,
+  `userId` varchar(50) NOT NULL,
+  `exerciseType` varchar(50) NOT NULL,
+  `duration` int(11) NOT NULL,
+  `intensity` varchar(50) NOT NULL,
+  `caloriesBurned` int(11) NOT NULL,
+  `timestamp` datetime DEFAULT NULL,
+  PRIMARY KEY (`id`),
+  KEY `idx_archive_userid_timestamp` (`userId`,`timestamp`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+--
+-- Table structure for table `activity_daily_rollup`
+--
+DROP TABLE IF EXISTS `activity_daily_rollup`;
+
+CREATE TABLE `activity_daily_rollup` (
+  `userId` varchar(50) NOT NULL,
+  `day` date NOT NULL,
+  `exerciseType` varchar(50) NOT NULL,
+  `sessions` int(11) NOT NULL DEFAULT 0,
+  `minutes` int(11) NOT NULL DEFAULT 0,
+  `calories` int(11) NOT NULL DEFAULT 0,
+  `intensitySum` int(11) NOT NULL DEFAULT 0,
+  PRIMARY KEY (`userId`,`day`,`exerciseType`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
 --
 -- Dumping data for table `activitylog`
 --
@@ -63,6 +97,17 @@ INSERT INTO `activitylog` (`id`, `userId`, `exerciseType`, `duration`, `intensit
 (17, '8', 'running', 35, 'medium', 350, '2025-03-26 18:45:00'),
 (18, '10', 'jogging', 30, 'low', 200, '2025-03-26 19:00:00');
 
+--
+-- Rollup of the sample data above
+--
+
+INSERT INTO `activity_daily_rollup` (`userId`, `day`, `exerciseType`, `sessions`, `minutes`, `calories`, `intensitySum`)
+SELECT `userId`, DATE(`timestamp`), `exerciseType`, COUNT(*), SUM(`duration`), SUM(`caloriesBurned`),
+       SUM(CASE LOWER(`intensity`) WHEN 'medium' THEN 2 WHEN 'high' THEN 3 ELSE 1 END)
+FROM `activitylog`
+WHERE `timestamp` IS NOT NULL
+GROUP BY `userId`, DATE(`timestamp`), `exerciseType`;
+
 --
 -- Indexes for dumped tables
 --
@@ -71,7 +116,9 @@ INSERT INTO `activitylog` (`id`, `userId`, `exerciseType`, `duration`, `intensit
 -- Indexes for table `activitylog`
 --
 ALTER TABLE `activitylog`
-  ADD PRIMARY KEY (`id`);
+  ADD PRIMARY KEY (`id`),
+  ADD KEY `idx_userid_timestamp` (`userId`,`timestamp`),
+  ADD KEY `idx_timestamp` (`timestamp`);
 
 --
 -- AUTO_INCREMENT for dumped tables
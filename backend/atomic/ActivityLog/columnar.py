@@ -0,0 +1,67 @@
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+ACTIVITY_SCHEMA = pa.schema([
+    ("id", pa.int64()),
+    ("userId", pa.string()),
+    ("exerciseType", pa.string()),
+    ("duration", pa.int32()),
+    ("intensity", pa.string()),
+    ("caloriesBurned", pa.int32()),
+    ("timestamp", pa.timestamp("us")),
+])
+
+class _ChunkSink:
+    """Write-only file object that hands back whatever was written since the last drain."""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+def to_record_batch(rows):
+    """Transpose a chunk of activity rows into one Arrow record batch."""
+    columns = list(zip(*rows)) if rows else [[] for _ in ACTIVITY_SCHEMA]
+    return pa.record_batch(
+        [pa.array(column, type=field.type) for column, field in zip(columns, ACTIVITY_SCHEMA)],
+        schema=ACTIVITY_SCHEMA
+    )
+
+def arrow_stream(chunks):
+    """Encode row chunks as an Arrow IPC stream, one record batch per chunk."""
+    sink = _ChunkSink()
+    with pa.ipc.new_stream(sink, ACTIVITY_SCHEMA) as writer:
+        yield sink.drain()
+        for rows in chunks:
+            writer.write_batch(to_record_batch(rows))
+            yield sink.drain()
+    yield sink.drain()
+
+def parquet_stream(chunks):
+    """Encode row chunks as a Parquet file, one row group per chunk."""
+    sink = _ChunkSink()
+    with pq.ParquetWriter(sink, ACTIVITY_SCHEMA, compression="zstd") as writer:
+        for rows in chunks:
+            writer.write_batch(to_record_batch(rows))
+            yield sink.drain()
+    yield sink.drain()
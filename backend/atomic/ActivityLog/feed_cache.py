@@ -0,0 +1,163 @@
+import os
+import json
+import logging
+import threading
+import time
+
+from redis import Redis, ConnectionPool
+
+logger = logging.getLogger(__name__)
+
+FEED_CACHE_ENABLED = os.getenv("ACTIVITY_FEED_CACHE", "true").lower() == "true"
+FEED_SIZE = int(os.getenv("ACTIVITY_FEED_SIZE", 50))
+FEED_TTL = int(os.getenv("ACTIVITY_FEED_TTL", 60 * 60))  # 1 hour
+
+_pool = None
+_pool_lock = threading.Lock()
+
+# Stores a freshly queried feed, unless a write bumped the user's generation
+# since the query started (the feed would then be stale).
+#   KEYS: feed key, generation key
+#   ARGV: generation seen before the query, TTL, JSON activities newest first
+POPULATE_SCRIPT = """
+if (redis.call('GET', KEYS[2]) or '0') ~= ARGV[1] then
+    return 0
+end
+redis.call('DEL', KEYS[1])
+redis.call('RPUSH', KEYS[1], unpack(ARGV, 3))
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return 1
+"""
+
+def get_pool():
+    """Get the process-wide Redis connection pool, creating it on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    host=os.getenv("REDIS_HOST", "localhost"),
+                    port=int(os.getenv("REDIS_PORT", 6379)),
+                    password=os.getenv("REDIS_PASSWORD", ""),
+                    max_connections=int(os.getenv("REDIS_MAX_CONNECTIONS", 50)),
+                    socket_timeout=float(os.getenv("REDIS_SOCKET_TIMEOUT", 0.5)),
+                    socket_connect_timeout=float(os.getenv("REDIS_SOCKET_TIMEOUT", 0.5)),
+                    decode_responses=True
+                )
+    return _pool
+
+def get_redis():
+    return Redis(connection_pool=get_pool())
+
+class FeedCache:
+    """Read-through Redis cache of each user's most recent activities.
+
+    Each feed is a list of JSON activities, newest first, holding one more
+    than FEED_SIZE so a full page can still tell whether more rows follow.
+    Redis errors are logged and counted, and callers fall back to MySQL.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._populate = None
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.hit_seconds = 0.0
+        self.miss_seconds = 0.0
+
+    @staticmethod
+    def feed_key(user_id):
+        return f"activity:feed:{user_id}"
+
+    @staticmethod
+    def generation_key(user_id):
+        return f"activity:feed:gen:{user_id}"
+
+    def get(self, user_id, limit, load):
+        """Get up to limit + 1 of a user's latest activities, newest first.
+
+        On a miss, load(n) must return the n latest activities from MySQL as
+        JSON dicts; they are returned and stored for the next read.
+        """
+        started = time.perf_counter()
+        redis = get_redis()
+        try:
+            with redis.pipeline(transaction=False) as pipe:
+                pipe.lrange(self.feed_key(user_id), 0, limit)
+                pipe.get(self.generation_key(user_id))
+                cached, generation = pipe.execute()
+        except Exception as e:
+            self._record_error(e)
+            return load(limit + 1)
+
+        if cached:
+            self._record("hit", started)
+            return [json.loads(item) for item in cached]
+
+        activities = load(FEED_SIZE + 1)
+        if activities:
+            try:
+                if self._populate is None:
+                    self._populate = redis.register_script(POPULATE_SCRIPT)
+                self._populate(
+                    keys=[self.feed_key(user_id), self.generation_key(user_id)],
+                    args=[generation or "0", FEED_TTL] + [json.dumps(a) for a in activities]
+                )
+            except Exception as e:
+                self._record_error(e)
+        self._record("miss", started)
+        return activities[:limit + 1]
+
+    def push(self, user_id, activity):
+        """Write-through a newly logged activity onto the user's feed, if it is cached."""
+        try:
+            with get_redis().pipeline(transaction=True) as pipe:
+                pipe.incr(self.generation_key(user_id))
+                pipe.expire(self.generation_key(user_id), FEED_TTL)
+                pipe.lpushx(self.feed_key(user_id), json.dumps(activity))
+                pipe.ltrim(self.feed_key(user_id), 0, FEED_SIZE)
+                pipe.execute()
+        except Exception as e:
+            self._record_error(e)
+
+    def invalidate(self, user_ids):
+        """Drop users' feeds, e.g. after a batch insert that may not be newest-first."""
+        try:
+            with get_redis().pipeline(transaction=True) as pipe:
+                for user_id in user_ids:
+                    pipe.incr(self.generation_key(user_id))
+                    pipe.expire(self.generation_key(user_id), FEED_TTL)
+                    pipe.delete(self.feed_key(user_id))
+                pipe.execute()
+        except Exception as e:
+            self._record_error(e)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": FEED_CACHE_ENABLED,
+                "feed_size": FEED_SIZE,
+                "hits": self.hits,
+                "misses": self.misses,
+                "errors": self.errors,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0,
+                "avg_hit_ms": round(self.hit_seconds / self.hits * 1000, 3) if self.hits else 0,
+                "avg_miss_ms": round(self.miss_seconds / self.misses * 1000, 3) if self.misses else 0
+            }
+
+    def _record(self, outcome, started):
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            if outcome == "hit":
+                self.hits += 1
+                self.hit_seconds += elapsed
+            else:
+                self.misses += 1
+                self.miss_seconds += elapsed
+
+    def _record_error(self, error):
+        logger.warning(f"Activity feed cache unavailable: {str(error)}")
+        with self._lock:
+            self.errors += 1
@@ -1,12 +1,21 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
 import datetime
+import heapq
+import json
 import os
+import threading
 import time
+import zlib
+from sqlalchemy import insert, delete, select, inspect
+from sqlalchemy.dialects.mysql import insert as mysql_insert
 from sqlalchemy.exc import SQLAlchemyError
 import logging
 
+import columnar
+from feed_cache import FeedCache, FEED_CACHE_ENABLED, FEED_SIZE
+
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
@@ -25,10 +34,21 @@ app.config['SQLALCHEMY_ECHO'] = True
 db = SQLAlchemy(app)
 
 
-class ActivityLog(db.Model):
-    __tablename__ = "activitylog"
+MAX_PAGE_SIZE = int(os.getenv("ACTIVITY_MAX_PAGE_SIZE", 500))
+EXPORT_CHUNK_SIZE = int(os.getenv("ACTIVITY_EXPORT_CHUNK_SIZE", 1000))
+MAX_BATCH_SIZE = int(os.getenv("ACTIVITY_MAX_BATCH_SIZE", 1000))
+SUMMARY_CHUNK_SIZE = int(os.getenv("ACTIVITY_SUMMARY_CHUNK_SIZE", 1000))
+REQUIRED_FIELDS = ["userId", "exerciseType", "duration", "intensity", "caloriesBurned"]
+# Months of activity kept in activitylog; older rows are moved to activitylog_archive
+HOT_MONTHS = int(os.getenv("ACTIVITY_HOT_MONTHS", 12))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ACTIVITY_ARCHIVE_BATCH_SIZE", 5000))
+ARCHIVE_INTERVAL = float(os.getenv("ACTIVITY_ARCHIVE_INTERVAL", 60 * 60 * 6))
 
-    id = db.Column(db.Integer, primary_key=True)
+feed_cache = FeedCache()
+
+
+class ActivityColumns:
+    """Columns shared by the hot activitylog table and its archive."""
     userId = db.Column(db.String(50), nullable=False)
     exerciseType = db.Column(db.String(50), nullable=False)
     duration = db.Column(db.Integer, nullable=False)
@@ -47,6 +67,199 @@ class ActivityLog(db.Model):
             "timestamp": self.timestamp.isoformat()
         }
 
+class ActivityLog(ActivityColumns, db.Model):
+    __tablename__ = "activitylog"
+    __table_args__ = (
+        db.Index("idx_userid_timestamp", "userId", "timestamp"),
+        db.Index("idx_timestamp", "timestamp"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+
+class ActivityLogArchive(ActivityColumns, db.Model):
+    """Activities older than the hot window, moved out of activitylog by the archive job."""
+    __tablename__ = "activitylog_archive"
+    __table_args__ = (
+        db.Index("idx_archive_userid_timestamp", "userId", "timestamp"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+
+def create_missing_indexes():
+    """Add model indexes (idx_userid_timestamp, idx_timestamp, ...) that an existing table lacks.
+
+    create_all never touches a table that already exists, so databases created
+    before an index was added would otherwise never get it. An index is only
+    created if no index already covers the same columns, so this is safe to
+    run on every startup.
+    """
+    inspector = inspect(db.engine)
+    for model in (ActivityLog, ActivityLogArchive):
+        indexed = {tuple(index["column_names"]) for index in inspector.get_indexes(model.__tablename__)}
+        for index in model.__table__.indexes:
+            if tuple(column.name for column in index.columns) not in indexed:
+                logger.info(f"Creating missing index {index.name} on {model.__tablename__}")
+                index.create(db.engine)
+
+def hot_cutoff(today=None):
+    """Start of the oldest month kept in activitylog."""
+    today = today or datetime.date.today()
+    months = today.year * 12 + today.month - 1 - HOT_MONTHS
+    return datetime.datetime(months // 12, months % 12 + 1, 1)
+
+def activity_tables(since=None):
+    """Tables holding activities from since onwards, newest first.
+
+    The archive only ever holds rows older than the cutoff, so windows that
+    start inside the hot range never touch it.
+    """
+    if since is not None and since >= hot_cutoff():
+        return [ActivityLog]
+    return [ActivityLog, ActivityLogArchive]
+
+def merge_newest_first(results):
+    """Merge per-table activity lists, each newest first, into one list ordered by (timestamp, id) descending.
+
+    Tables can't simply be concatenated: a batch insert can backfill rows
+    into activitylog that are older than rows already archived.
+    """
+    return list(heapq.merge(*results, key=lambda activity: (activity.timestamp, activity.id), reverse=True))
+
+def archive_old_activities(batch_size=None):
+    """Move activities older than the hot window into activitylog_archive, one batch per transaction."""
+    batch_size = batch_size or ARCHIVE_BATCH_SIZE
+    cutoff = hot_cutoff()
+    columns = [column.name for column in ActivityLog.__table__.columns]
+    moved = 0
+    while True:
+        ids = db.session.execute(
+            select(ActivityLog.id).where(ActivityLog.timestamp < cutoff)
+            .order_by(ActivityLog.timestamp).limit(batch_size)
+        ).scalars().all()
+        if not ids:
+            break
+        try:
+            db.session.execute(insert(ActivityLogArchive).from_select(
+                columns, select(*ActivityLog.__table__.columns).where(ActivityLog.id.in_(ids))
+            ))
+            db.session.execute(delete(ActivityLog).where(ActivityLog.id.in_(ids)))
+            db.session.commit()
+        except SQLAlchemyError:
+            db.session.rollback()
+            raise
+        moved += len(ids)
+    if moved:
+        logger.info(f"Archived {moved} activities older than {cutoff.date()}")
+    return moved
+
+class ActivityArchiver(threading.Thread):
+    """Background thread that periodically moves cold activities to the archive table."""
+
+    def __init__(self, interval=None):
+        super().__init__(name="activity-archiver", daemon=True)
+        self.interval = interval or ARCHIVE_INTERVAL
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.is_set():
+            try:
+                with app.app_context():
+                    archive_old_activities()
+            except Exception as e:
+                logger.error(f"Activity archive failed: {str(e)}")
+            self._stopped.wait(self.interval)
+
+    def stop(self):
+        self._stopped.set()
+
+@app.cli.command("archive-activities")
+def archive_activities_command():
+    """Move cold activities to the archive table now: flask --app main archive-activities"""
+    db.create_all()
+    print(f"Archived {archive_old_activities()} activities")
+
+class ActivityDailyRollup(db.Model):
+    """Per-user, per-day, per-exerciseType totals, kept in step with activitylog on every write."""
+    __tablename__ = "activity_daily_rollup"
+
+    userId = db.Column(db.String(50), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    exerciseType = db.Column(db.String(50), primary_key=True)
+    sessions = db.Column(db.Integer, nullable=False, default=0)
+    minutes = db.Column(db.Integer, nullable=False, default=0)
+    calories = db.Column(db.Integer, nullable=False, default=0)
+    intensitySum = db.Column(db.Integer, nullable=False, default=0)
+
+
+INTENSITY_SCORES = {"low": 1, "medium": 2, "high": 3}
+
+def intensity_score(intensity):
+    return INTENSITY_SCORES.get(str(intensity).lower(), 1)
+
+def intensity_score_expr(model=None):
+    """SQL equivalent of intensity_score for aggregating raw rows."""
+    model = model or ActivityLog
+    return db.case(
+        (db.func.lower(model.intensity) == "medium", 2),
+        (db.func.lower(model.intensity) == "high", 3),
+        else_=1
+    )
+
+def add_to_rollup(rows):
+    """Add activity rows to the daily rollup with one upsert, inside the caller's transaction."""
+    deltas = {}
+    for row in rows:
+        key = (str(row["userId"]), row["timestamp"].date(), row["exerciseType"])
+        delta = deltas.setdefault(key, {"sessions": 0, "minutes": 0, "calories": 0, "intensitySum": 0})
+        delta["sessions"] += 1
+        delta["minutes"] += int(row["duration"])
+        delta["calories"] += int(row["caloriesBurned"])
+        delta["intensitySum"] += intensity_score(row["intensity"])
+    if not deltas:
+        return
+
+    statement = mysql_insert(ActivityDailyRollup).values([
+        {"userId": user_id, "day": day, "exerciseType": exercise_type, **delta}
+        for (user_id, day, exercise_type), delta in deltas.items()
+    ])
+    db.session.execute(statement.on_duplicate_key_update(
+        sessions=ActivityDailyRollup.sessions + statement.inserted.sessions,
+        minutes=ActivityDailyRollup.minutes + statement.inserted.minutes,
+        calories=ActivityDailyRollup.calories + statement.inserted.calories,
+        intensitySum=ActivityDailyRollup.intensitySum + statement.inserted.intensitySum
+    ))
+
+@app.cli.command("backfill-rollup")
+def backfill_rollup():
+    """Rebuild the daily rollup from the raw activity rows: flask --app main backfill-rollup"""
+    rows = db.union_all(*[
+        select(model.userId, model.exerciseType, model.duration, model.intensity, model.caloriesBurned, model.timestamp)
+        for model in activity_tables()
+    ]).subquery()
+    day = db.func.date(rows.c.timestamp)
+    aggregate = select(
+        rows.c.userId,
+        day,
+        rows.c.exerciseType,
+        db.func.count(),
+        db.func.sum(rows.c.duration),
+        db.func.sum(rows.c.caloriesBurned),
+        db.func.sum(intensity_score_expr(rows.c))
+    ).where(rows.c.timestamp.isnot(None)).group_by(rows.c.userId, day, rows.c.exerciseType)
+
+    try:
+        db.create_all()
+        db.session.execute(db.delete(ActivityDailyRollup))
+        result = db.session.execute(insert(ActivityDailyRollup).from_select(
+            ["userId", "day", "exerciseType", "sessions", "minutes", "calories", "intensitySum"],
+            aggregate
+        ))
+        db.session.commit()
+        print(f"Backfilled {result.rowcount} daily rollup rows")
+    except SQLAlchemyError:
+        db.session.rollback()
+        raise
+
 @app.route("/health", methods=["GET"])
 def health_check():
     try:
@@ -64,10 +277,96 @@ def health_check():
         }), 500
 
 
+EXPORT_COLUMNS = ["id", "userId", "exerciseType", "duration", "intensity", "caloriesBurned", "timestamp"]
+
+def iter_export_chunks(chunk_size, since=None, until=None, user_ids=None):
+    """Yield matching activity rows in chunks, reading each table in id-ordered keyset chunks.
+
+    Rows are plain column tuples in EXPORT_COLUMNS order (no ORM objects), so
+    memory stays flat across the export.
+    """
+    for model in reversed(activity_tables(since)):
+        last_id = 0
+        while True:
+            query = select(*[getattr(model, column) for column in EXPORT_COLUMNS]).where(model.id > last_id)
+            if since:
+                query = query.where(model.timestamp >= since)
+            if until:
+                query = query.where(model.timestamp < until)
+            if user_ids:
+                query = query.where(model.userId.in_(user_ids))
+            rows = db.session.execute(query.order_by(model.id).limit(chunk_size)).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+            yield rows
+            if len(rows) < chunk_size:
+                break
+
+def ndjson_stream(chunks):
+    for rows in chunks:
+        lines = []
+        for row in rows:
+            activity = row._asdict()
+            activity["timestamp"] = activity["timestamp"].isoformat() if activity["timestamp"] else None
+            lines.append(json.dumps(activity) + "\n")
+        yield "".join(lines).encode()
+
+def gzip_stream(chunks):
+    compressor = zlib.compressobj(wbits=31)  # gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+EXPORT_FORMATS = {
+    "ndjson": ("application/x-ndjson", "activitylog.ndjson"),
+    "arrow": ("application/vnd.apache.arrow.stream", "activitylog.arrow"),
+    "parquet": ("application/vnd.apache.parquet", "activitylog.parquet"),
+}
+
+def export_activities(export_format):
+    """Stream matching activities as NDJSON, an Arrow IPC stream or Parquet.
+
+    Filters: since/until (ISO timestamps) and users (comma-separated ids).
+    NDJSON and Arrow are gzipped if the client accepts it; Parquet is
+    already compressed.
+    """
+    try:
+        since = parse_time_arg("since")
+        until = parse_time_arg("until")
+    except ValueError:
+        return jsonify({"error": "Invalid time format. Use ISO format (e.g., 2023-04-15T14:30:00)"}), 400
+    user_ids = [user_id for user_id in request.args.get("users", "").split(",") if user_id]
+
+    chunks = iter_export_chunks(EXPORT_CHUNK_SIZE, since, until, user_ids)
+    if export_format == "ndjson":
+        body = ndjson_stream(chunks)
+    else:
+        body = columnar.arrow_stream(chunks) if export_format == "arrow" else columnar.parquet_stream(chunks)
+
+    mimetype, filename = EXPORT_FORMATS[export_format]
+    headers = {"Content-Disposition": f"attachment; filename={filename}"}
+    if export_format != "parquet" and "gzip" in request.accept_encodings:
+        body = gzip_stream(body)
+        headers["Content-Encoding"] = "gzip"
+    return Response(stream_with_context(body), mimetype=mimetype, headers=headers)
+
 @app.route("/activity", methods=["GET"])
 def get_all_activities():
+    export_format = request.args.get("format")
+    if export_format is None:
+        export_format = next(
+            (name for name, (mimetype, _) in EXPORT_FORMATS.items() if request.accept_mimetypes.best == mimetype),
+            None
+        )
+    if export_format in EXPORT_FORMATS:
+        return export_activities(export_format)
     try:
-        activities = ActivityLog.query.order_by(ActivityLog.timestamp.desc()).all()
+        activities = merge_newest_first(
+            model.query.order_by(model.timestamp.desc(), model.id.desc()).all() for model in activity_tables()
+        )
         if not activities:
             return jsonify({"message": "No activity records found"}), 404
         return jsonify([a.json() for a in activities]), 200
@@ -80,33 +379,349 @@ def log_activity():
     if not data:
         return jsonify({"error": "No data provided"}), 400
 
-    required_fields = ["userId", "exerciseType", "duration", "intensity", "caloriesBurned"]
-    if not all(field in data for field in required_fields):
+    if not all(field in data for field in REQUIRED_FIELDS):
         return jsonify({"error": "Missing required fields"}), 400
 
+    # The rollup needs integer minutes and calories, so check them before writing anything
     try:
-        activity = ActivityLog(
-            userId=data["userId"],
-            exerciseType=data["exerciseType"],
-            duration=data["duration"],
-            intensity=data["intensity"],
-            caloriesBurned=data["caloriesBurned"]
-        )
+        row = validate_activity(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    row["timestamp"] = datetime.datetime.now()
+
+    try:
+        activity = ActivityLog(**row)
 
         db.session.add(activity)
+        add_to_rollup([row])
         db.session.commit()
+        if FEED_CACHE_ENABLED:
+            feed_cache.push(activity.userId, activity.json())
         return jsonify(activity.json()), 201
     except SQLAlchemyError as e:
         db.session.rollback()
         return jsonify({"error": "Database error occurred"}), 500
 
+def encode_cursor(activity):
+    return f"{activity['timestamp']},{activity['id']}"
+
+def decode_cursor(cursor):
+    timestamp, activity_id = cursor.rsplit(",", 1)
+    return datetime.datetime.fromisoformat(timestamp), int(activity_id)
+
+def validate_activity(data):
+    """Build an insert row from one batch item, or raise ValueError describing the problem."""
+    if not isinstance(data, dict):
+        raise ValueError("Activity must be an object")
+    missing = [field for field in REQUIRED_FIELDS if field not in data]
+    if missing:
+        raise ValueError(f"Missing required fields: {', '.join(missing)}")
+    try:
+        duration = int(data["duration"])
+        calories_burned = int(data["caloriesBurned"])
+    except (TypeError, ValueError):
+        raise ValueError("duration and caloriesBurned must be integers")
+    timestamp = data.get("timestamp")
+    if timestamp:
+        try:
+            timestamp = datetime.datetime.fromisoformat(timestamp)
+        except (TypeError, ValueError):
+            raise ValueError("timestamp must be an ISO format string (e.g., 2023-04-15T14:30:00)")
+    return {
+        "userId": str(data["userId"]),
+        "exerciseType": data["exerciseType"],
+        "duration": duration,
+        "intensity": data["intensity"],
+        "caloriesBurned": calories_burned,
+        "timestamp": timestamp or datetime.datetime.now()
+    }
+
+@app.route("/activity/batch", methods=["POST"])
+def log_activities():
+    """Validate a list of activities and insert them all in one multi-row statement."""
+    data = request.get_json()
+    if not data or not isinstance(data, list):
+        return jsonify({"error": "Expected a non-empty list of activities"}), 400
+    if len(data) > MAX_BATCH_SIZE:
+        return jsonify({"error": f"Batch too large, at most {MAX_BATCH_SIZE} activities per request"}), 400
+
+    rows = []
+    errors = []
+    for index, item in enumerate(data):
+        try:
+            rows.append(validate_activity(item))
+        except ValueError as e:
+            errors.append({"index": index, "error": str(e)})
+    # The batch is one transaction, so a single bad item rejects all of it
+    if errors:
+        return jsonify({"error": "Invalid activities", "details": errors}), 400
+
+    try:
+        result = db.session.execute(insert(ActivityLog).values(rows))
+        add_to_rollup(rows)
+        db.session.commit()
+        if FEED_CACHE_ENABLED:
+            feed_cache.invalidate({row["userId"] for row in rows})
+        # MySQL reports the first id of a multi-row insert, and InnoDB gives the
+        # rows of a single INSERT ... VALUES consecutive ids
+        first_id = result.lastrowid
+        return jsonify({
+            "count": len(rows),
+            "ids": list(range(first_id, first_id + len(rows)))
+        }), 201
+    except SQLAlchemyError:
+        db.session.rollback()
+        return jsonify({"error": "Database error occurred"}), 500
+
+@app.route("/activity/cache/stats", methods=["GET"])
+def get_feed_cache_stats():
+    return jsonify(feed_cache.stats()), 200
+
+def user_totals_chunk(after_user_id, chunk_size, since=None, until=None, user_ids=None):
+    """Per-user session, minute and calorie totals for the next chunk of users after after_user_id.
+
+    Day-aligned windows sum the daily rollup; other windows sum raw rows from
+    the tables the window needs. Each table is grouped and cut off at its own
+    next chunk_size users, so a chunk only reads those users' rows, and the
+    per-table totals are then merged.
+    """
+    if is_whole_day(since) and is_whole_day(until):
+        branches = [select(
+            ActivityDailyRollup.userId.label("userId"),
+            db.func.sum(ActivityDailyRollup.sessions).label("sessions"),
+            db.func.sum(ActivityDailyRollup.minutes).label("minutes"),
+            db.func.sum(ActivityDailyRollup.calories).label("calories")
+        ).where(
+            ActivityDailyRollup.userId > after_user_id,
+            *([ActivityDailyRollup.day >= since.date()] if since else []),
+            *([ActivityDailyRollup.day < until.date()] if until else []),
+            *([ActivityDailyRollup.userId.in_(user_ids)] if user_ids else [])
+        ).group_by(ActivityDailyRollup.userId).order_by(ActivityDailyRollup.userId).limit(chunk_size)]
+    else:
+        branches = [select(
+            model.userId.label("userId"),
+            db.func.count().label("sessions"),
+            db.func.sum(model.duration).label("minutes"),
+            db.func.sum(model.caloriesBurned).label("calories")
+        ).where(
+            model.userId > after_user_id,
+            *([model.timestamp >= since] if since else []),
+            *([model.timestamp < until] if until else []),
+            *([model.userId.in_(user_ids)] if user_ids else [])
+        ).group_by(model.userId).order_by(model.userId).limit(chunk_size) for model in activity_tables(since)]
+
+    if len(branches) == 1:
+        return db.session.execute(branches[0]).all()
+
+    # A user among the next chunk_size overall is also among the next chunk_size
+    # of every table it appears in, so its per-table totals are all present
+    rows = db.union_all(*(select(branch.subquery()) for branch in branches)).subquery()
+    return db.session.execute(
+        select(rows.c.userId, db.func.sum(rows.c.sessions), db.func.sum(rows.c.minutes), db.func.sum(rows.c.calories))
+        .group_by(rows.c.userId)
+        .order_by(rows.c.userId)
+        .limit(chunk_size)
+    ).all()
+
+def iter_user_totals(since=None, until=None, user_ids=None):
+    """Yield per-user totals as NDJSON, one chunk of users at a time in userId order.
+
+    An explicit id list is sorted once and walked in slices, so each query
+    only binds its own chunk's ids instead of the whole list.
+    """
+    def encode(totals):
+        return "".join(json.dumps({
+            "userId": user_id,
+            "total_sessions": int(sessions),
+            "total_minutes": int(minutes or 0),
+            "total_calories": int(calories or 0)
+        }) + "\n" for user_id, sessions, minutes, calories in totals).encode()
+
+    if user_ids:
+        user_ids = sorted(set(user_ids))
+        for start in range(0, len(user_ids), SUMMARY_CHUNK_SIZE):
+            chunk_ids = user_ids[start:start + SUMMARY_CHUNK_SIZE]
+            totals = user_totals_chunk("", len(chunk_ids), since, until, chunk_ids)
+            if totals:
+                yield encode(totals)
+        return
+
+    last_user_id = ""
+    while True:
+        totals = user_totals_chunk(last_user_id, SUMMARY_CHUNK_SIZE, since, until)
+        if not totals:
+            return
+        last_user_id = totals[-1][0]
+        yield encode(totals)
+        if len(totals) < SUMMARY_CHUNK_SIZE:
+            return
+
+@app.route("/activity/summary", methods=["GET", "POST"])
+def get_users_summary():
+    """Stream per-user totals for many users (or "all") over [since, until) as NDJSON.
+
+    GET takes users=all or a comma-separated list; POST takes the same fields
+    in a JSON body, for id lists too long for a URL. Users with no activity in
+    the window are left out.
+    """
+    params = (request.get_json(silent=True) or {}) if request.method == "POST" else request.args
+    users = params.get("users", "all")
+    if isinstance(users, str):
+        users = users.split(",") if users != "all" else []
+    if not isinstance(users, list) or not all(isinstance(user_id, (str, int)) for user_id in users):
+        users = None
+    user_ids = [str(user_id) for user_id in users or [] if str(user_id)]
+    if not user_ids and params.get("users", "all") != "all":
+        return jsonify({"error": "users must be \"all\" or a non-empty list of user ids"}), 400
+
+    try:
+        since = datetime.datetime.fromisoformat(params["since"]) if params.get("since") else None
+        until = datetime.datetime.fromisoformat(params["until"]) if params.get("until") else None
+    except (TypeError, ValueError):
+        return jsonify({"error": "Invalid time format. Use ISO format (e.g., 2023-04-15T14:30:00)"}), 400
+
+    body = iter_user_totals(since, until, user_ids)
+    headers = {}
+    if "gzip" in request.accept_encodings:
+        body = gzip_stream(body)
+        headers["Content-Encoding"] = "gzip"
+    return Response(stream_with_context(body), mimetype="application/x-ndjson", headers=headers)
+
 @app.route("/activity/<userId>", methods=["GET"])
 def get_activities(userId):
+    limit = request.args.get("limit", type=int)
+    before = request.args.get("before")
     try:
-        activities = ActivityLog.query.filter_by(userId=userId).order_by(ActivityLog.timestamp.desc()).all()
-        if not activities:
+        def user_query(model):
+            return model.query.filter_by(userId=userId).order_by(model.timestamp.desc(), model.id.desc())
+
+        # Without a limit, keep returning the full history as a plain list
+        if limit is None:
+            activities = merge_newest_first(user_query(model).all() for model in activity_tables())
+            if not activities:
+                return jsonify({"message": f"No activity records found for user {userId}"}), 404
+            return jsonify([a.json() for a in activities]), 200
+
+        if limit < 1:
+            return jsonify({"error": "limit must be a positive integer"}), 400
+        limit = min(limit, MAX_PAGE_SIZE)
+
+        # Keyset pagination: seek past the cursor on (userId, timestamp) instead of using OFFSET
+        cursor = None
+        if before:
+            try:
+                cursor = decode_cursor(before)
+            except ValueError:
+                return jsonify({"error": "Invalid before cursor"}), 400
+
+        def load(n):
+            # The newest n of each table, merged: backfilled hot rows can be older than archived ones
+            pages = []
+            for model in activity_tables():
+                query = user_query(model)
+                if cursor:
+                    before_timestamp, before_id = cursor
+                    query = query.filter(db.or_(
+                        model.timestamp < before_timestamp,
+                        db.and_(model.timestamp == before_timestamp, model.id < before_id)
+                    ))
+                pages.append(query.limit(n).all())
+            return [a.json() for a in merge_newest_first(pages)[:n]]
+
+        # Fetch one extra row to know whether another page follows;
+        # the first page of a recent feed is served from Redis
+        if FEED_CACHE_ENABLED and not before and limit <= FEED_SIZE:
+            activities = feed_cache.get(userId, limit, load)
+        else:
+            activities = load(limit + 1)
+        if not activities and not before:
             return jsonify({"message": f"No activity records found for user {userId}"}), 404
-        return jsonify([a.json() for a in activities]), 200
+
+        has_more = len(activities) > limit
+        activities = activities[:limit]
+        return jsonify({
+            "activities": activities,
+            "next_cursor": encode_cursor(activities[-1]) if has_more else None
+        }), 200
+    except SQLAlchemyError:
+        return jsonify({"error": "Database error occurred"}), 500
+
+def parse_time_arg(name):
+    value = request.args.get(name)
+    return datetime.datetime.fromisoformat(value) if value else None
+
+def is_whole_day(moment):
+    return moment is None or moment.time() == datetime.time.min
+
+@app.route("/activity/<userId>/summary", methods=["GET"])
+def get_activity_summary(userId):
+    """Aggregate a user's activities in [since, until) in SQL, overall and per exercise type."""
+    try:
+        since = parse_time_arg("since")
+        until = parse_time_arg("until")
+    except ValueError:
+        return jsonify({"error": "Invalid time format. Use ISO format (e.g., 2023-04-15T14:30:00)"}), 400
+
+    try:
+        if is_whole_day(since) and is_whole_day(until):
+            # Day-aligned windows only need the handful of rollup rows they cover
+            query = db.session.query(
+                ActivityDailyRollup.exerciseType,
+                db.func.sum(ActivityDailyRollup.sessions),
+                db.func.sum(ActivityDailyRollup.minutes),
+                db.func.sum(ActivityDailyRollup.calories),
+                db.func.sum(ActivityDailyRollup.intensitySum)
+            ).filter(ActivityDailyRollup.userId == userId)
+            if since:
+                query = query.filter(ActivityDailyRollup.day >= since.date())
+            if until:
+                query = query.filter(ActivityDailyRollup.day < until.date())
+            groups = query.group_by(ActivityDailyRollup.exerciseType).all()
+        else:
+            # Windows inside the hot range never read the archive
+            groups = []
+            for model in activity_tables(since):
+                query = db.session.query(
+                    model.exerciseType,
+                    db.func.count(model.id),
+                    db.func.coalesce(db.func.sum(model.duration), 0),
+                    db.func.coalesce(db.func.sum(model.caloriesBurned), 0),
+                    db.func.sum(intensity_score_expr(model))
+                ).filter(model.userId == userId)
+                if since:
+                    query = query.filter(model.timestamp >= since)
+                if until:
+                    query = query.filter(model.timestamp < until)
+                groups += query.group_by(model.exerciseType).all()
+
+        if not groups and not any(
+            db.session.query(model.query.filter_by(userId=userId).exists()).scalar()
+            for model in activity_tables()
+        ):
+            return jsonify({"message": f"No activity records found for user {userId}"}), 404
+
+        by_exercise_type = {}
+        total_sessions = total_minutes = total_calories = total_intensity = 0
+        for exercise_type, sessions, minutes, calories, intensity in groups:
+            breakdown = by_exercise_type.setdefault(exercise_type, {"sessions": 0, "minutes": 0, "calories": 0})
+            breakdown["sessions"] += int(sessions)
+            breakdown["minutes"] += int(minutes)
+            breakdown["calories"] += int(calories)
+            total_sessions += int(sessions)
+            total_minutes += int(minutes)
+            total_calories += int(calories)
+            total_intensity += int(intensity or 0)
+
+        return jsonify({
+            "userId": userId,
+            "since": since.isoformat() if since else None,
+            "until": until.isoformat() if until else None,
+            "total_sessions": total_sessions,
+            "total_minutes": total_minutes,
+            "total_calories": total_calories,
+            "avg_intensity": round(total_intensity / total_sessions, 2) if total_sessions else 0,
+            "by_exercise_type": by_exercise_type
+        }), 200
     except SQLAlchemyError:
         return jsonify({"error": "Database error occurred"}), 500
 
@@ -117,6 +732,7 @@ if __name__ == "__main__":
         try:
             with app.app_context():
                 db.create_all()
+                create_missing_indexes()
             break
         except SQLAlchemyError:
             retry_count += 1
@@ -125,4 +741,9 @@ if __name__ == "__main__":
                 exit(1)
             time.sleep(2)
     
-    app.run(host="0.0.0.0", port=5030, debug=True)
+    debug = True
+    # The debug reloader runs this module in a watcher process too; only the serving child starts the archiver
+    if not debug or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        # Activities older than ACTIVITY_HOT_MONTHS are moved out of the hot table in the background
+        ActivityArchiver().start()
+    app.run(host="0.0.0.0", port=5030, debug=debug)
@@ -0,0 +1,41 @@
+import os
+import logging
+
+from database import app, add_weekly_snapshot, count_weekly_snapshot
+from cache import LeaderboardCache, get_redis
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+ARCHIVE_CHUNK_SIZE = int(os.environ.get("LEADERBOARD_ARCHIVE_CHUNK_SIZE", 1000))
+
+def archive_week(leaderboard_key: str, year: int, week: int, chunk_size: int = None) -> int:
+    """Snapshot a finished week's final ranking from Redis into MySQL.
+
+    The sorted set is read from the top in chunks and each chunk is written
+    with one multi-row INSERT. Weeks that are already fully archived are
+    skipped, and a partial archive is completed on the next run.
+    """
+    chunk_size = chunk_size or ARCHIVE_CHUNK_SIZE
+    with app.app_context():
+        if count_weekly_snapshot(year, week) >= get_redis().zcard(leaderboard_key):
+            return 0
+
+        archived = 0
+        for chunk in LeaderboardCache.iter_leaderboard(leaderboard_key, chunk_size):
+            archived += add_weekly_snapshot(year, week, chunk)
+
+    logger.info(f"Archived {archived} users from {leaderboard_key}")
+    return archived
+
+def archive_finished_weeks(batch_size: int = 500) -> int:
+    """Archive every past week's overall leaderboard still in Redis.
+
+    Raises on failure, so the caller can keep the weeks in Redis until they
+    have been archived.
+    """
+    archived = 0
+    for leaderboard_key, year, week in LeaderboardCache.get_finished_weekly_keys(batch_size):
+        archived += archive_week(leaderboard_key, year, week)
+    return archived
@@ -0,0 +1,125 @@
+"""
+Micro-benchmark for the LeaderboardCache write path.
+
+Compares the legacy access pattern (a fresh connection per cache method and
+one round trip per command) with the pooled, pipelined implementation in
+cache.py, in both friends leaderboard modes (fanout on write and computed on
+read), reporting connections, round trips and latency per activity write.
+
+Requires a reachable Redis (REDIS_HOST / REDIS_PORT). The benchmark runs in a
+scratch logical database (--db, default 15) which is flushed before and after.
+
+    python bench_cache.py --writes 500 --friends 20
+    python bench_cache.py --writes 200 --friends 1000
+"""
+import argparse
+import os
+import time
+
+from redis import Redis, ConnectionPool
+from redis.connection import Connection
+
+import cache
+from cache import LeaderboardCache
+
+class CountingConnection(Connection):
+    """Connection that counts TCP connects and request/response round trips."""
+    connects = 0
+    round_trips = 0
+
+    def connect(self):
+        if self._sock is None:
+            CountingConnection.connects += 1
+        return super().connect()
+
+    def send_packed_command(self, command, check_health=True):
+        CountingConnection.round_trips += 1
+        return super().send_packed_command(command, check_health)
+
+def connection_kwargs(db):
+    return {
+        "host": os.environ.get("REDIS_HOST", "localhost"),
+        "port": int(os.environ.get("REDIS_PORT", 6379)),
+        "password": os.environ.get("REDIS_PASSWORD", ""),
+        "db": db,
+        "decode_responses": True,
+        "connection_class": CountingConnection
+    }
+
+def legacy_redis(db):
+    """Mirror the old get_redis(): a brand new client and connection per call."""
+    return Redis(connection_pool=ConnectionPool(**connection_kwargs(db)))
+
+def legacy_write(db, user_id, calories_burned, friends):
+    """The pre-pooling write path: one connection per method, one command per round trip."""
+    weekly_key = LeaderboardCache.get_weekly_leaderboard_key()
+
+    redis = legacy_redis(db)
+    redis.zincrby(weekly_key, calories_burned, user_id)
+    redis.expire(weekly_key, cache.WEEKLY_TTL)
+    redis.close()
+
+    redis = legacy_redis(db)
+    user_total = redis.zscore(weekly_key, user_id) or 0
+    user_friends_key = LeaderboardCache.get_friends_leaderboard_key(user_id)
+    redis.zadd(user_friends_key, {user_id: user_total})
+    for friend in friends:
+        friend_id = str(friend["Id"])
+        friend_total = redis.zscore(weekly_key, friend_id) or 0
+        redis.zadd(user_friends_key, {friend_id: friend_total})
+    redis.expire(user_friends_key, cache.FRIENDS_TTL)
+    for friend in friends:
+        friend_id = str(friend["Id"])
+        friend_leaderboard_key = LeaderboardCache.get_friends_leaderboard_key(friend_id)
+        redis.zadd(friend_leaderboard_key, {user_id: user_total})
+        redis.expire(friend_leaderboard_key, cache.FRIENDS_TTL)
+    redis.close()
+
+def pooled_write(db, user_id, calories_burned, friends):
+    LeaderboardCache.update_leaderboards(user_id, calories_burned)
+    LeaderboardCache.update_friends_leaderboard(user_id, friends)
+
+def run(name, write, args, friends_mode="fanout"):
+    cache.FRIENDS_LEADERBOARD_MODE = friends_mode
+    friends = [{"Id": f"bench-friend-{i}"} for i in range(args.friends)]
+    CountingConnection.connects = 0
+    CountingConnection.round_trips = 0
+
+    started = time.perf_counter()
+    for i in range(args.writes):
+        write(args.db, f"bench-user-{i % args.users}", 100.0, friends)
+    elapsed = time.perf_counter() - started
+
+    print(
+        f"{name:<8} "
+        f"connections/write={CountingConnection.connects / args.writes:6.2f}  "
+        f"round_trips/write={CountingConnection.round_trips / args.writes:7.2f}  "
+        f"latency/write={elapsed / args.writes * 1000:7.3f} ms"
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark LeaderboardCache writes")
+    parser.add_argument("--writes", type=int, default=500, help="activity writes per run")
+    parser.add_argument("--friends", type=int, default=20, help="friends per writing user")
+    parser.add_argument("--users", type=int, default=50, help="distinct writing users")
+    parser.add_argument("--db", type=int, default=15, help="scratch Redis database to use")
+    args = parser.parse_args()
+
+    # Point the cache module's shared pool at the scratch database
+    cache._pool = ConnectionPool(**connection_kwargs(args.db))
+    scratch = Redis(**{k: v for k, v in connection_kwargs(args.db).items() if k != "connection_class"})
+
+    try:
+        print(f"{args.writes} writes, {args.friends} friends each, {args.users} users")
+        scratch.flushdb()
+        run("legacy", legacy_write, args)
+        scratch.flushdb()
+        run("fanout", pooled_write, args, "fanout")
+        scratch.flushdb()
+        run("read", pooled_write, args, "read")
+    finally:
+        scratch.flushdb()
+        scratch.close()
+
+if __name__ == "__main__":
+    main()
@@ -1,159 +1,792 @@
 import os
+import itertools
 import logging
-from datetime import datetime
-from redis import Redis
-from typing import List, Dict, Optional, Tuple
+import threading
+import time
+from datetime import date, datetime, timedelta
+from redis import Redis, ConnectionPool
+from typing import Iterable, List, Dict, Optional, Tuple
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+WEEKLY_TTL = 60 * 60 * 24 * 21  # 3 weeks
+FRIENDS_TTL = 60 * 60 * 24 * 14  # 2 weeks
+
+# Leaderboard windows and how long each window's sorted sets are kept
+WINDOWS = ("daily", "weekly", "monthly", "alltime")
+WINDOW_TTLS = {
+    "daily": 60 * 60 * 24 * 3,  # 3 days
+    "weekly": WEEKLY_TTL,
+    "monthly": 60 * 60 * 24 * 62,  # 2 months
+    "alltime": None
+}
+
+# "fanout" copies totals into every friend's board on write; "read" stores only
+# the user's friend set and builds the board from the weekly set when read.
+FRIENDS_LEADERBOARD_MODE = os.environ.get("FRIENDS_LEADERBOARD_MODE", "fanout")
+FRIENDS_MEMO_TTL = int(os.environ.get("FRIENDS_LEADERBOARD_MEMO_TTL", 30))
+
+# Apply each activity write (boards and fanout) as one server-side script call
+ATOMIC_WRITES = os.environ.get("LEADERBOARD_ATOMIC_WRITES", "false").lower() == "true"
+
+# Weekly score distribution: fixed-width buckets, the last one open-ended
+HISTOGRAM_BUCKET_WIDTH = float(os.environ.get("LEADERBOARD_HISTOGRAM_BUCKET_WIDTH", 100))
+HISTOGRAM_MAX_BUCKET = int(os.environ.get("LEADERBOARD_HISTOGRAM_MAX_BUCKET", 200))
+
+# How long a rebuild's staging key, marker and delta may live if the rebuild dies
+REBUILD_TTL = 60 * 60  # 1 hour
+
+_pool = None
+_pool_lock = threading.Lock()
+
+# Returns {rank, total, start, [member, score, ...]} for the members around
+# ARGV[1], or {-1, total, 0, {}} when the member is not on the board.
+AROUND_ME_SCRIPT = """
+local rank = redis.call('ZREVRANK', KEYS[1], ARGV[1])
+local total = redis.call('ZCARD', KEYS[1])
+if not rank then
+    return {-1, total, 0, {}}
+end
+local radius = tonumber(ARGV[2])
+local start = math.max(rank - radius, 0)
+local entries = redis.call('ZREVRANGE', KEYS[1], start, rank + radius, 'WITHSCORES')
+return {rank, total, start, entries}
+"""
+
+# Applies one activity atomically: increments every board and its version,
+# refreshes TTLs and, if the current week's board is among them, moves the
+# user between weekly histogram buckets. A board
+# that is being rebuilt (its marker exists) also gets the increment in its
+# rebuild delta. When friends keys are passed it also writes the user's new
+# weekly total into each friend's board and every friend's current total
+# into the user's own.
+#   KEYS: n boards, n version keys, n rebuild markers, n rebuild deltas,
+#         weekly key, histogram key, [user's friends key, one friends key per friend]
+#   ARGV: user_id, increment, n, friends TTL, bucket width, max bucket,
+#         weekly TTL, n board TTLs (0 = none), friend ids
+ACTIVITY_WRITE_SCRIPT = """
+local user_id = ARGV[1]
+local increment = ARGV[2]
+local n_boards = tonumber(ARGV[3])
+local friends_ttl = tonumber(ARGV[4])
+local bucket_width = tonumber(ARGV[5])
+local max_bucket = tonumber(ARGV[6])
+local weekly_ttl = tonumber(ARGV[7])
+local weekly_key = KEYS[4 * n_boards + 1]
+local hist_key = KEYS[4 * n_boards + 2]
+
+local function bucket(score)
+    return math.max(math.min(math.floor(tonumber(score) / bucket_width), max_bucket), 0)
+end
+
+local previous = redis.call('ZSCORE', weekly_key, user_id)
+local counts_this_week = false
+
+for i = 1, n_boards do
+    if KEYS[i] == weekly_key then
+        counts_this_week = true
+    end
+    local ttl = tonumber(ARGV[7 + i])
+    redis.call('ZINCRBY', KEYS[i], increment, user_id)
+    redis.call('INCR', KEYS[n_boards + i])
+    if ttl > 0 then
+        redis.call('EXPIRE', KEYS[i], ttl)
+        redis.call('EXPIRE', KEYS[n_boards + i], ttl)
+    end
+    local rebuild_ttl = redis.call('TTL', KEYS[2 * n_boards + i])
+    if rebuild_ttl > 0 then
+        redis.call('ZINCRBY', KEYS[3 * n_boards + i], increment, user_id)
+        redis.call('EXPIRE', KEYS[3 * n_boards + i], rebuild_ttl)
+    end
+end
+
+local total = redis.call('ZSCORE', weekly_key, user_id) or 0
+if counts_this_week then
+    if previous then
+        redis.call('HINCRBY', hist_key, bucket(previous), -1)
+    end
+    redis.call('HINCRBY', hist_key, bucket(total), 1)
+    redis.call('EXPIRE', hist_key, weekly_ttl)
+end
+
+if #KEYS > 4 * n_boards + 2 then
+    local own_key = KEYS[4 * n_boards + 3]
+    redis.call('ZADD', own_key, total, user_id)
+
+    local first_friend = 8 + n_boards
+    for j = first_friend, #ARGV do
+        local friend_id = ARGV[j]
+        local friend_key = KEYS[4 * n_boards + 4 + (j - first_friend)]
+        local friend_total = redis.call('ZSCORE', weekly_key, friend_id) or 0
+        redis.call('ZADD', own_key, friend_total, friend_id)
+        redis.call('ZADD', friend_key, total, user_id)
+        redis.call('EXPIRE', friend_key, friends_ttl)
+    end
+    redis.call('EXPIRE', own_key, friends_ttl)
+end
+
+return tostring(total)
+"""
+
+# Swaps a rebuilt staging board in for the live one. Increments that writers
+# recorded in the rebuild delta while MySQL was being read are added to the
+# staging board first, and the histogram counts (bucket, count pairs computed
+# from the loaded scores) are corrected for them. The version jumps to a
+# time-based value: counters restart from zero after Redis loses data, so this
+# moves it past any version an old ETag could still carry.
+#   KEYS: board, staging key, rebuild delta, rebuild marker, histogram key, version key
+#   ARGV: TTL (0 = none), rebuild histogram (1/0), bucket width, max bucket,
+#         version, bucket/count pairs
+REBUILD_SWAP_SCRIPT = """
+local ttl = tonumber(ARGV[1])
+local with_histogram = ARGV[2] == '1'
+local bucket_width = tonumber(ARGV[3])
+local max_bucket = tonumber(ARGV[4])
+
+local function bucket(score)
+    return tostring(math.max(math.min(math.floor(tonumber(score) / bucket_width), max_bucket), 0))
+end
+
+local counts = {}
+for i = 6, #ARGV, 2 do
+    counts[ARGV[i]] = tonumber(ARGV[i + 1])
+end
+
+local delta = redis.call('ZRANGE', KEYS[3], 0, -1, 'WITHSCORES')
+for i = 1, #delta, 2 do
+    local previous = redis.call('ZSCORE', KEYS[2], delta[i])
+    local total = redis.call('ZINCRBY', KEYS[2], delta[i + 1], delta[i])
+    if previous then
+        counts[bucket(previous)] = (counts[bucket(previous)] or 0) - 1
+    end
+    counts[bucket(total)] = (counts[bucket(total)] or 0) + 1
+end
+redis.call('DEL', KEYS[3], KEYS[4])
+
+if redis.call('EXISTS', KEYS[2]) == 1 then
+    redis.call('RENAME', KEYS[2], KEYS[1])
+    if ttl > 0 then
+        redis.call('EXPIRE', KEYS[1], ttl)
+    end
+else
+    redis.call('DEL', KEYS[1])
+end
+
+if with_histogram then
+    redis.call('DEL', KEYS[5])
+    for index, count in pairs(counts) do
+        if count > 0 then
+            redis.call('HSET', KEYS[5], index, count)
+        end
+    end
+    if ttl > 0 then
+        redis.call('EXPIRE', KEYS[5], ttl)
+    end
+end
+
+if ttl > 0 then
+    redis.call('SET', KEYS[6], ARGV[5], 'EX', ttl)
+else
+    redis.call('SET', KEYS[6], ARGV[5])
+end
+return redis.call('ZCARD', KEYS[1])
+"""
+
+_scripts = {}
+
+def get_pool():
+    """Get the process-wide Redis connection pool, creating it on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    host=os.environ.get("REDIS_HOST", "localhost"),
+                    port=int(os.environ.get("REDIS_PORT", 6379)),
+                    password=os.environ.get("REDIS_PASSWORD", ""),
+                    max_connections=int(os.environ.get("REDIS_MAX_CONNECTIONS", 50)),
+                    decode_responses=True
+                )
+    return _pool
+
 def get_redis():
-    """Get Redis connection instance with configuration from environment variables."""
-    redis_host = os.environ.get("REDIS_HOST", "localhost")
-    redis_port = int(os.environ.get("REDIS_PORT", 6379))
-    redis_password = os.environ.get("REDIS_PASSWORD", "")
-    
-    return Redis(
-        host=redis_host,
-        port=redis_port,
-        password=redis_password,
-        decode_responses=True
-    )
+    """Get a Redis client backed by the shared connection pool.
+
+    Clients are cheap wrappers; connections are borrowed from the pool per
+    command (or per pipeline) and returned immediately afterwards.
+    """
+    return Redis(connection_pool=get_pool())
+
+def get_script(source: str):
+    """Get a registered Lua script; it is loaded once and then invoked by SHA."""
+    script = _scripts.get(source)
+    if script is None:
+        script = _scripts[source] = get_redis().register_script(source)
+    return script
 
 class LeaderboardCache:
     """Redis-based cache for leaderboard operations using sorted sets."""
     
+    @staticmethod
+    def get_iso_week(when: Optional[datetime] = None) -> Tuple[int, int]:
+        """Get the (ISO year, ISO week) of a date.
+
+        The ISO year differs from the calendar year around New Year, e.g.
+        2024-12-30 falls in week 1 of 2025, so weekly keys must use it.
+        """
+        year, week, _ = (when or datetime.now()).isocalendar()
+        return year, week
+
+    @staticmethod
+    def get_leaderboard_key(window: str, activity_type: Optional[str] = None, when: Optional[datetime] = None):
+        """Generate the Redis key for a window's leaderboard, optionally for one activity type."""
+        when = when or datetime.now()
+        if window == "daily":
+            period = when.strftime("%Y-%m-%d")
+        elif window == "weekly":
+            period = "{}:{}".format(*LeaderboardCache.get_iso_week(when))
+        elif window == "monthly":
+            period = f"{when.year}:{when.month}"
+        elif window == "alltime":
+            period = None
+        else:
+            raise ValueError(f"Unknown leaderboard window: {window}")
+        
+        parts = ["leaderboard", window]
+        if activity_type:
+            parts += ["type", LeaderboardCache.normalize_activity_type(activity_type)]
+        if period:
+            parts.append(period)
+        return ":".join(parts)
+
+    @staticmethod
+    def normalize_activity_type(activity_type: str) -> str:
+        """Normalize an activity type for use inside a Redis key."""
+        return activity_type.strip().lower().replace(":", "_").replace(" ", "_")
+
+    @staticmethod
+    def get_activity_keys(activity_type: Optional[str] = None, when: Optional[datetime] = None) -> List[Tuple[str, Optional[int]]]:
+        """Get every (key, ttl) an activity at time when contributes to: each window, overall and per type.
+
+        Only windows still open are included. A backdated activity from an
+        earlier day, week or month skips those boards, just as rebuilding
+        them from MySQL would leave it out; the all-time boards always count it.
+        """
+        now = datetime.now()
+        keys = []
+        for window in WINDOWS:
+            leaderboard_key = LeaderboardCache.get_leaderboard_key(window, when=when)
+            if leaderboard_key != LeaderboardCache.get_leaderboard_key(window, when=now):
+                continue
+            keys.append((leaderboard_key, WINDOW_TTLS[window]))
+            if activity_type:
+                keys.append((LeaderboardCache.get_leaderboard_key(window, activity_type, when), WINDOW_TTLS[window]))
+        return keys
+
+    @staticmethod
+    def get_version_key(leaderboard_key: str):
+        """Generate the Redis key holding the write version of a leaderboard."""
+        return leaderboard_key.replace("leaderboard:", "leaderboard:version:", 1)
+
+    @staticmethod
+    def bump_version(pipe, leaderboard_key: str, ttl: Optional[int] = None):
+        """Queue a version bump for a leaderboard on a pipeline, so cached pages of it go stale."""
+        version_key = LeaderboardCache.get_version_key(leaderboard_key)
+        pipe.incr(version_key)
+        if ttl:
+            pipe.expire(version_key, ttl)
+
+    @staticmethod
+    def get_rebuild_marker_key(leaderboard_key: str):
+        """Generate the Redis key that marks a leaderboard as being rebuilt."""
+        return leaderboard_key.replace("leaderboard:", "leaderboard:rebuilding:", 1)
+
+    @staticmethod
+    def get_rebuild_delta_key(leaderboard_key: str):
+        """Generate the Redis key collecting a leaderboard's increments while it is rebuilt."""
+        return leaderboard_key.replace("leaderboard:", "leaderboard:rebuild-delta:", 1)
+
+    @staticmethod
+    def get_histogram_key(leaderboard_key: str):
+        """Generate the Redis key holding the bucketed score distribution of a leaderboard."""
+        return leaderboard_key.replace("leaderboard:", "leaderboard:hist:", 1)
+
+    @staticmethod
+    def get_bucket(score: float) -> int:
+        """Histogram bucket index for a score, matching the bucketing in ACTIVITY_WRITE_SCRIPT."""
+        return max(min(int(score // HISTOGRAM_BUCKET_WIDTH), HISTOGRAM_MAX_BUCKET), 0)
+
+    @staticmethod
+    def get_versions(leaderboard_keys: List[str]) -> List[int]:
+        """Get the current write versions of several keys in one round trip (0 if never written)."""
+        version_keys = [LeaderboardCache.get_version_key(key) for key in leaderboard_keys]
+        return [int(version or 0) for version in get_redis().mget(version_keys)]
+
     @staticmethod
     def get_weekly_leaderboard_key():
         """Generate the Redis key for the current week's leaderboard."""
-        today = datetime.now()
-        week_number = today.isocalendar()[1]
-        year = today.year
-        return f"leaderboard:weekly:{year}:{week_number}"
+        return LeaderboardCache.get_leaderboard_key("weekly")
 
     @staticmethod
     def get_friends_leaderboard_key(user_id: str):
         """Generate the Redis key for a user's friends leaderboard."""
-        today = datetime.now()
-        week_number = today.isocalendar()[1]
-        year = today.year
+        year, week_number = LeaderboardCache.get_iso_week()
         return f"leaderboard:friends:{user_id}:{year}:{week_number}"
 
     @staticmethod
-    def update_leaderboards(user_id: str, calories_burned: float, timestamp: Optional[datetime] = None):
-        """Update weekly leaderboard with new activity data."""
-        redis = get_redis()
+    def get_friend_set_key(user_id: str):
+        """Generate the Redis key holding a user's friend ids (read-time mode)."""
+        return f"leaderboard:friendset:{user_id}"
+
+    @staticmethod
+    def get_friends_view_key(user_id: str):
+        """Generate the Redis key for a user's memoized read-time friends board."""
+        year, week_number = LeaderboardCache.get_iso_week()
+        return f"leaderboard:friendsview:{user_id}:{year}:{week_number}"
+
+    @staticmethod
+    def get_window_range(window: str, today: Optional[datetime] = None) -> Tuple[Optional[datetime], Optional[datetime]]:
+        """Get the [start, end) datetimes a window's current leaderboard covers (None if unbounded)."""
+        today = today or datetime.now()
+        midnight = datetime(today.year, today.month, today.day)
+        if window == "daily":
+            return midnight, midnight + timedelta(days=1)
+        if window == "weekly":
+            start = midnight - timedelta(days=today.weekday())
+            return start, start + timedelta(days=7)
+        if window == "monthly":
+            start = midnight.replace(day=1)
+            return start, (start + timedelta(days=32)).replace(day=1)
+        if window == "alltime":
+            return None, None
+        raise ValueError(f"Unknown leaderboard window: {window}")
+
+    @staticmethod
+    def get_weekly_range(today: Optional[datetime] = None) -> Tuple[datetime, datetime]:
+        """Get the [start, end) datetimes of the ISO week the weekly leaderboard covers."""
+        return LeaderboardCache.get_window_range("weekly", today)
+
+    @staticmethod
+    def update_leaderboards(user_id: str, calories_burned: float, timestamp: Optional[datetime] = None,
+                            activity_type: Optional[str] = None):
+        """Update every window's leaderboard, overall and per activity type, in a single round trip."""
         try:
             if not timestamp:
                 timestamp = datetime.now()
             
-            weekly_key = LeaderboardCache.get_weekly_leaderboard_key()
-            redis.zincrby(weekly_key, calories_burned, user_id)
-            redis.expire(weekly_key, 60 * 60 * 24 * 21)  # 3 weeks
+            LeaderboardCache.apply_activity_script(user_id, calories_burned, activity_type, timestamp=timestamp)
             
-            logger.info(f"Updated weekly leaderboard for user {user_id}")
+            logger.info(f"Updated leaderboards for user {user_id}")
             return f"activity:{user_id}:{int(timestamp.timestamp())}"
         except Exception as e:
             logger.error(f"Error updating leaderboard: {str(e)}")
             raise
-        finally:
-            redis.close()
+
+    @staticmethod
+    def apply_activity_script(user_id: str, calories_burned: float, activity_type: Optional[str] = None,
+                              friend_ids: Optional[List[str]] = None, timestamp: Optional[datetime] = None) -> float:
+        """Run ACTIVITY_WRITE_SCRIPT for one activity; friends are fanned out only if friend_ids is given."""
+        boards = LeaderboardCache.get_activity_keys(activity_type, timestamp)
+        weekly_key = LeaderboardCache.get_weekly_leaderboard_key()
+        
+        keys = [key for key, _ in boards]
+        keys += [LeaderboardCache.get_version_key(key) for key, _ in boards]
+        keys += [LeaderboardCache.get_rebuild_marker_key(key) for key, _ in boards]
+        keys += [LeaderboardCache.get_rebuild_delta_key(key) for key, _ in boards]
+        keys.append(weekly_key)
+        keys.append(LeaderboardCache.get_histogram_key(weekly_key))
+        
+        args = [user_id, calories_burned, len(boards), FRIENDS_TTL,
+                HISTOGRAM_BUCKET_WIDTH, HISTOGRAM_MAX_BUCKET, WEEKLY_TTL]
+        args += [ttl or 0 for _, ttl in boards]
+        
+        if friend_ids is not None:
+            keys.append(LeaderboardCache.get_friends_leaderboard_key(user_id))
+            keys += [LeaderboardCache.get_friends_leaderboard_key(friend_id) for friend_id in friend_ids]
+            args += friend_ids
+        
+        return float(get_script(ACTIVITY_WRITE_SCRIPT)(keys=keys, args=args))
+
+    @staticmethod
+    def update_leaderboards_atomic(user_id: str, calories_burned: float, friends: List[Dict],
+                                   activity_type: Optional[str] = None, timestamp: Optional[datetime] = None) -> float:
+        """Update every board and fan the new total out to friends in one atomic script call.
+
+        Unlike update_leaderboards followed by update_friends_leaderboard, no
+        other write can interleave, so concurrent writes within a friend group
+        can never leave a stale total behind. Returns the user's weekly total.
+        """
+        try:
+            friend_ids = [str(friend["Id"]) for friend in friends]
+            total = LeaderboardCache.apply_activity_script(user_id, calories_burned, activity_type, friend_ids, timestamp)
+            
+            logger.info(f"Updated leaderboards atomically for user {user_id}")
+            return total
+        except Exception as e:
+            logger.error(f"Error updating leaderboard atomically: {str(e)}")
+            raise
+
+    @staticmethod
+    def update_leaderboards_bulk(increments: Dict[Tuple[str, Optional[str], date], float]):
+        """Apply aggregated score increments, keyed by (user_id, activity_type, day), in one MULTI.
+
+        Each day's increments only reach the windows still open on it (see
+        get_activity_keys). Boards that are being rebuilt also get the
+        increments in their rebuild delta. A second MULTI moves each user
+        with a current-week increment between weekly histogram buckets.
+        """
+        if not increments:
+            return
+        redis = get_redis()
+        try:
+            weekly_key = LeaderboardCache.get_weekly_leaderboard_key()
+            boards = {
+                (activity_type, day): LeaderboardCache.get_activity_keys(activity_type, datetime.combine(day, datetime.min.time()))
+                for _, activity_type, day in increments
+            }
+            weekly_users = list(dict.fromkeys(
+                user_id for user_id, activity_type, day in increments
+                if any(key == weekly_key for key, _ in boards[(activity_type, day)])
+            ))
+            ttls = {}
+            weekly_positions = {}
+            
+            board_keys = list(dict.fromkeys(key for keys in boards.values() for key, _ in keys))
+            if not board_keys:
+                return
+            markers = redis.mget([LeaderboardCache.get_rebuild_marker_key(key) for key in board_keys])
+            rebuilding = {key for key, marker in zip(board_keys, markers) if marker}
+            
+            with redis.pipeline(transaction=True) as pipe:
+                # Weekly totals before and after the batch, for the score histogram
+                if weekly_users:
+                    pipe.zmscore(weekly_key, weekly_users)
+                for (user_id, activity_type, day), calories_burned in increments.items():
+                    for key, ttl in boards[(activity_type, day)]:
+                        pipe.zincrby(key, calories_burned, user_id)
+                        if key == weekly_key:
+                            weekly_positions[user_id] = len(pipe.command_stack) - 1
+                        if key in rebuilding:
+                            pipe.zincrby(LeaderboardCache.get_rebuild_delta_key(key), calories_burned, user_id)
+                        ttls[key] = ttl
+                for key, ttl in ttls.items():
+                    if ttl:
+                        pipe.expire(key, ttl)
+                    if key in rebuilding:
+                        pipe.expire(LeaderboardCache.get_rebuild_delta_key(key), REBUILD_TTL)
+                    LeaderboardCache.bump_version(pipe, key, ttl)
+                results = pipe.execute()
+            
+            if weekly_users:
+                histogram_key = LeaderboardCache.get_histogram_key(weekly_key)
+                with redis.pipeline(transaction=True) as pipe:
+                    for user_id, previous in zip(weekly_users, results[0]):
+                        if previous is not None:
+                            pipe.hincrby(histogram_key, LeaderboardCache.get_bucket(previous), -1)
+                        pipe.hincrby(histogram_key, LeaderboardCache.get_bucket(results[weekly_positions[user_id]]), 1)
+                    pipe.expire(histogram_key, WEEKLY_TTL)
+                    pipe.execute()
+            
+            logger.info(f"Updated leaderboards for {len(increments)} user/activity/day groups")
+        except Exception as e:
+            logger.error(f"Error updating leaderboard in bulk: {str(e)}")
+            raise
 
     @staticmethod
     def update_friends_leaderboard(user_id: str, friends: List[Dict]):
-        """Update friends leaderboards using provided friends list."""
+        """Update friends leaderboards using provided friends list.
+
+        In fanout mode this costs two round trips regardless of friend count:
+        one ZMSCORE to read the current weekly totals, then one MULTI/EXEC with
+        every write. In read mode only the user's friend set is stored and no
+        other user's key is touched.
+        """
         redis = get_redis()
         weekly_key = LeaderboardCache.get_weekly_leaderboard_key()
         
         try:
-            # Get user's current total from weekly leaderboard
-            user_total = redis.zscore(weekly_key, user_id) or 0
-            
-            # Update user's own friends leaderboard
-            user_friends_key = LeaderboardCache.get_friends_leaderboard_key(user_id)
+            friend_ids = [str(friend["Id"]) for friend in friends]
             
-            # Add user to their own leaderboard
-            redis.zadd(user_friends_key, {user_id: user_total})
+            if FRIENDS_LEADERBOARD_MODE == "read":
+                friend_set_key = LeaderboardCache.get_friend_set_key(user_id)
+                with redis.pipeline(transaction=True) as pipe:
+                    pipe.delete(friend_set_key)
+                    pipe.sadd(friend_set_key, user_id, *friend_ids)
+                    pipe.expire(friend_set_key, FRIENDS_TTL)
+                    pipe.execute()
+                return
             
-            # Add each friend to user's leaderboard with their current total
-            for friend in friends:
-                friend_id = str(friend["Id"])
-                friend_total = redis.zscore(weekly_key, friend_id) or 0
-                redis.zadd(user_friends_key, {friend_id: friend_total})
+            # Get user's and friends' current totals from weekly leaderboard
+            totals = redis.zmscore(weekly_key, [user_id] + friend_ids)
+            user_total = totals[0] or 0
             
-            # Set expiration for user's friends leaderboard
-            redis.expire(user_friends_key, 60 * 60 * 24 * 14)
+            user_friends_key = LeaderboardCache.get_friends_leaderboard_key(user_id)
             
-            # Update each friend's leaderboard to include the user
-            for friend in friends:
-                friend_id = str(friend["Id"])
-                friend_leaderboard_key = LeaderboardCache.get_friends_leaderboard_key(friend_id)
-                redis.zadd(friend_leaderboard_key, {user_id: user_total})
-                redis.expire(friend_leaderboard_key, 60 * 60 * 24 * 14)
+            with redis.pipeline(transaction=True) as pipe:
+                # Add user and each friend to user's leaderboard with their current total
+                members = {user_id: user_total}
+                for friend_id, friend_total in zip(friend_ids, totals[1:]):
+                    members[friend_id] = friend_total or 0
+                pipe.zadd(user_friends_key, members)
+                pipe.expire(user_friends_key, FRIENDS_TTL)
+                
+                # Update each friend's leaderboard to include the user
+                for friend_id in friend_ids:
+                    friend_leaderboard_key = LeaderboardCache.get_friends_leaderboard_key(friend_id)
+                    pipe.zadd(friend_leaderboard_key, {user_id: user_total})
+                    pipe.expire(friend_leaderboard_key, FRIENDS_TTL)
+                pipe.execute()
             
         except Exception as e:
             logger.error(f"Error updating friends leaderboard: {str(e)}")
             raise
-        finally:
-            redis.close()
+
+    @staticmethod
+    def begin_rebuild(leaderboard_key: str, stream_key: str) -> Optional[str]:
+        """Mark a leaderboard as being rebuilt, so writers start recording increments in its delta.
+
+        Returns the id of the last entry in stream_key at that moment (None if
+        empty); buffered entries up to it are not in the delta.
+        """
+        with get_redis().pipeline(transaction=True) as pipe:
+            pipe.set(LeaderboardCache.get_rebuild_marker_key(leaderboard_key), 1, ex=REBUILD_TTL)
+            pipe.delete(LeaderboardCache.get_rebuild_delta_key(leaderboard_key))
+            pipe.xrevrange(stream_key, count=1)
+            last = pipe.execute()[2]
+        return last[0][0] if last else None
+
+    @staticmethod
+    def load_leaderboard(leaderboard_key: str, chunks: Iterable[List[Tuple[str, float]]], ttl: Optional[int] = None,
+                         with_histogram: bool = False, pending: Optional[Dict[str, float]] = None) -> int:
+        """Replace a leaderboard with streamed (member, score) chunks.
+
+        Chunks are written to a staging key, one pipelined ZADD per chunk, and
+        swapped in with REBUILD_SWAP_SCRIPT so readers never see a partially
+        loaded board. Scores in pending (e.g. writes not yet in MySQL) are
+        added on top, and so is anything writers put in the rebuild delta since
+        begin_rebuild. With with_histogram, the score histogram is rebuilt
+        alongside it.
+        """
+        redis = get_redis()
+        staging_key = leaderboard_key.replace("leaderboard:", "leaderboard:rebuild:", 1)
+        histogram_key = LeaderboardCache.get_histogram_key(leaderboard_key)
+        pending = dict(pending or {})
+        buckets = {}
+        loaded = 0
+        try:
+            redis.delete(staging_key)
+            for chunk in itertools.chain(chunks, [None]):
+                if chunk is None:
+                    # Users with pending scores but nothing in MySQL yet
+                    chunk = list(pending.items())
+                    pending = {}
+                else:
+                    chunk = [(member, score + pending.pop(member, 0.0)) for member, score in chunk]
+                if not chunk:
+                    continue
+                with redis.pipeline(transaction=False) as pipe:
+                    pipe.zadd(staging_key, dict(chunk))
+                    pipe.expire(staging_key, REBUILD_TTL)
+                    pipe.execute()
+                if with_histogram:
+                    for _, score in chunk:
+                        bucket = LeaderboardCache.get_bucket(score)
+                        buckets[bucket] = buckets.get(bucket, 0) + 1
+                loaded += len(chunk)
+            
+            args = [ttl or 0, 1 if with_histogram else 0, HISTOGRAM_BUCKET_WIDTH, HISTOGRAM_MAX_BUCKET,
+                    int(time.time() * 1000)]
+            for bucket, count in buckets.items():
+                args += [bucket, count]
+            loaded = get_script(REBUILD_SWAP_SCRIPT)(
+                keys=[
+                    leaderboard_key,
+                    staging_key,
+                    LeaderboardCache.get_rebuild_delta_key(leaderboard_key),
+                    LeaderboardCache.get_rebuild_marker_key(leaderboard_key),
+                    histogram_key,
+                    LeaderboardCache.get_version_key(leaderboard_key)
+                ],
+                args=args
+            )
+            
+            logger.info(f"Loaded {loaded} members into {leaderboard_key}")
+            return loaded
+        except Exception as e:
+            logger.error(f"Error loading leaderboard: {str(e)}")
+            redis.delete(
+                staging_key,
+                LeaderboardCache.get_rebuild_delta_key(leaderboard_key),
+                LeaderboardCache.get_rebuild_marker_key(leaderboard_key)
+            )
+            raise
 
     @staticmethod
     def get_leaderboard(leaderboard_key: str, limit: int, offset: int) -> Tuple[List[Tuple[str, float]], int]:
         """Get leaderboard entries with pagination."""
         redis = get_redis()
         try:
-            total_users = redis.zcard(leaderboard_key)
-            leaderboard_data = redis.zrevrange(
-                leaderboard_key, 
-                offset, 
-                offset + limit - 1, 
-                withscores=True
-            )
+            with redis.pipeline() as pipe:
+                pipe.zcard(leaderboard_key)
+                pipe.zrevrange(
+                    leaderboard_key, 
+                    offset, 
+                    offset + limit - 1, 
+                    withscores=True
+                )
+                total_users, leaderboard_data = pipe.execute()
             return leaderboard_data, total_users
         except Exception as e:
             logger.error(f"Error getting leaderboard data: {str(e)}")
             raise
-        finally:
-            redis.close()
+
+    @staticmethod
+    def get_friends_leaderboard(user_id: str, limit: int, offset: int = 0) -> Tuple[List[Tuple[str, float]], int]:
+        """Get a user's friends leaderboard with pagination.
+
+        In read mode the board is computed server-side from the user's friend
+        set and the weekly sorted set, then memoized for a few seconds.
+        """
+        if FRIENDS_LEADERBOARD_MODE != "read":
+            friends_key = LeaderboardCache.get_friends_leaderboard_key(user_id)
+            return LeaderboardCache.get_leaderboard(friends_key, limit, offset)
+
+        redis = get_redis()
+        view_key = LeaderboardCache.get_friends_view_key(user_id)
+        try:
+            if not redis.exists(view_key):
+                weekly_key = LeaderboardCache.get_weekly_leaderboard_key()
+                friend_set_key = LeaderboardCache.get_friend_set_key(user_id)
+                with redis.pipeline(transaction=True) as pipe:
+                    # Friends with a weekly score, then every friend at 0 so idle friends still show
+                    pipe.zinterstore(view_key, {friend_set_key: 0, weekly_key: 1})
+                    pipe.zunionstore(view_key, {friend_set_key: 0, view_key: 1})
+                    pipe.expire(view_key, FRIENDS_MEMO_TTL)
+                    pipe.execute()
+        except Exception as e:
+            logger.error(f"Error building friends leaderboard: {str(e)}")
+            raise
+        return LeaderboardCache.get_leaderboard(view_key, limit, offset)
 
     @staticmethod
     def get_user_rank(user_id: str, leaderboard_key: str) -> Tuple[Optional[float], Optional[int], int]:
         """Get a user's rank, score and total users in a specific leaderboard."""
         redis = get_redis()
         try:
-            calories = redis.zscore(leaderboard_key, user_id)
-            rank = redis.zrevrank(leaderboard_key, user_id)
+            with redis.pipeline() as pipe:
+                pipe.zscore(leaderboard_key, user_id)
+                pipe.zrevrank(leaderboard_key, user_id)
+                pipe.zcard(leaderboard_key)
+                calories, rank, total_users = pipe.execute()
             if rank is not None:
                 rank += 1  # Convert to 1-based ranking
-            total_users = redis.zcard(leaderboard_key)
             return calories, rank, total_users
         except Exception as e:
             logger.error(f"Error getting user rank: {str(e)}")
             raise
-        finally:
-            redis.close()
 
     @staticmethod
-    def clear_old_data():
-        """Clear any data in Redis that's not the current week's leaderboard."""
+    def get_rank_around(user_id: str, leaderboard_key: str, radius: int) -> Tuple[Optional[int], int, List[Tuple[str, float, int]]]:
+        """Get a user's 1-based rank, the board size and the entries within radius ranks of them.
+
+        Runs as one server-side script, so the rank and neighbours come from the
+        same snapshot of the sorted set in a single round trip.
+        """
+        try:
+            rank, total_users, start, flat = get_script(AROUND_ME_SCRIPT)(keys=[leaderboard_key], args=[user_id, radius])
+            if rank < 0:
+                return None, total_users, []
+            entries = [
+                (flat[i], float(flat[i + 1]), start + i // 2 + 1)
+                for i in range(0, len(flat), 2)
+            ]
+            return rank + 1, total_users, entries
+        except Exception as e:
+            logger.error(f"Error getting rank around user: {str(e)}")
+            raise
+
+    @staticmethod
+    def get_distribution(leaderboard_key: str, user_id: Optional[str] = None) -> Tuple[Dict[int, int], Optional[float]]:
+        """Get a leaderboard's bucket counts, and optionally a user's score, in one round trip.
+
+        Cost is O(buckets), independent of how many users are on the board.
+        """
         redis = get_redis()
         try:
-            current_weekly_key = LeaderboardCache.get_weekly_leaderboard_key()
-            all_leaderboard_keys = redis.keys("leaderboard:*")
-            
-            keys_to_delete = []
-            for key in all_leaderboard_keys:
-                if key != current_weekly_key and not key.startswith("leaderboard:friends:"):
-                    keys_to_delete.append(key)
+            with redis.pipeline(transaction=True) as pipe:
+                pipe.hgetall(LeaderboardCache.get_histogram_key(leaderboard_key))
+                if user_id is not None:
+                    pipe.zscore(leaderboard_key, user_id)
+                results = pipe.execute()
+            buckets = {int(bucket): int(count) for bucket, count in results[0].items() if int(count) > 0}
+            score = results[1] if user_id is not None else None
+            return buckets, score
+        except Exception as e:
+            logger.error(f"Error getting score distribution: {str(e)}")
+            raise
+
+    @staticmethod
+    def get_finished_weekly_keys(batch_size: int = 500) -> List[Tuple[str, int, int]]:
+        """Find overall weekly leaderboards of past weeks still held in Redis.
+
+        Returns (key, year, week) tuples; per-type weekly boards are skipped.
+        """
+        redis = get_redis()
+        current_week = LeaderboardCache.get_iso_week()
+        finished = []
+        for key in redis.scan_iter(match="leaderboard:weekly:*", count=batch_size):
+            parts = key.split(":")
+            if len(parts) != 4 or not (parts[2].isdigit() and parts[3].isdigit()):
+                continue
+            year, week = int(parts[2]), int(parts[3])
+            if (year, week) != current_week:
+                finished.append((key, year, week))
+        return sorted(finished, key=lambda item: (item[1], item[2]))
+
+    @staticmethod
+    def iter_leaderboard(leaderboard_key: str, chunk_size: int = 1000) -> Iterable[List[Tuple[str, float, int]]]:
+        """Walk a leaderboard from the top in chunks of (user_id, score, 1-based rank)."""
+        redis = get_redis()
+        offset = 0
+        while True:
+            chunk = redis.zrevrange(leaderboard_key, offset, offset + chunk_size - 1, withscores=True)
+            if not chunk:
+                return
+            yield [(user_id, score, rank) for rank, (user_id, score) in enumerate(chunk, start=offset + 1)]
+            if len(chunk) < chunk_size:
+                return
+            offset += chunk_size
+
+    @staticmethod
+    def clear_old_data(batch_size: int = 500) -> int:
+        """Delete weekly and friends leaderboards that belong to a past week.
+
+        Keys are walked incrementally with SCAN and removed with UNLINK in
+        batches, so Redis is never blocked on a full keyspace walk.
+        """
+        redis = get_redis()
+        current_week = "{}:{}".format(*LeaderboardCache.get_iso_week())
+        deleted = 0
+        try:
+            for pattern in ("leaderboard:weekly:*", "leaderboard:friends:*"):
+                batch = []
+                for key in redis.scan_iter(match=pattern, count=batch_size):
+                    # Both key families end in {year}:{week}
+                    if ":".join(key.rsplit(":", 2)[-2:]) == current_week:
+                        continue
+                    batch.append(key)
+                    if len(batch) >= batch_size:
+                        deleted += redis.unlink(*batch)
+                        batch = []
+                if batch:
+                    deleted += redis.unlink(*batch)
             
-            if keys_to_delete:
-                redis.delete(*keys_to_delete)
-                logger.info(f"Cleared {len(keys_to_delete)} old leaderboard keys")
+            if deleted:
+                logger.info(f"Cleared {deleted} old leaderboard keys")
             
-            return len(keys_to_delete)
+            return deleted
         except Exception as e:
             logger.error(f"Error clearing old data: {str(e)}")
-            return 0
-        finally:
-            redis.close()
\ No newline at end of file
+            return deleted
@@ -1,6 +1,7 @@
 from flask import Flask
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import insert, select, func, inspect, text
 from os import environ
 from datetime import datetime
 
@@ -17,12 +18,17 @@ db = SQLAlchemy(app)
 
 class Leaderboards(db.Model):
     __tablename__ = 'leaderboards'
+    __table_args__ = (
+        db.Index('idx_timestamp_user_id', 'timestamp', 'user_id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     user_id = db.Column(db.String, nullable=False, index=True)
     calories_burned = db.Column(db.Float, nullable=False)
     activity_type = db.Column(db.String, nullable=True)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    # Write-behind buffer entry id, so replayed entries are inserted only once
+    stream_id = db.Column(db.String(32), nullable=True, unique=True)
 
     def __init__(self, user_id, calories_burned, activity_type=None, timestamp=None):
         self.user_id = user_id
@@ -39,9 +45,55 @@ class Leaderboards(db.Model):
             "timestamp": self.timestamp.isoformat()
         }
 
+class WeeklySnapshot(db.Model):
+    """Final ranking of a finished week, archived from Redis before the week is swept."""
+    __tablename__ = 'weekly_snapshots'
+    __table_args__ = (
+        db.Index('idx_year_week_rank', 'year', 'week', 'rank'),
+        db.Index('idx_user_id_year_week', 'user_id', 'year', 'week'),
+    )
+
+    year = db.Column(db.SmallInteger, primary_key=True, autoincrement=False)
+    week = db.Column(db.SmallInteger, primary_key=True, autoincrement=False)
+    user_id = db.Column(db.String(255), primary_key=True)
+    total = db.Column(db.Float, nullable=False)
+    rank = db.Column(db.Integer, nullable=False)
+
+    def json(self):
+        return {
+            "year": self.year,
+            "week": self.week,
+            "user_id": self.user_id,
+            "calories_burned": self.total,
+            "rank": self.rank
+        }
+
+def upgrade_leaderboards_table():
+    """
+    Bring a leaderboards table created by an older version up to date;
+    create_all never alters a table that already exists
+    
+    Adds the write-behind stream_id column and any index from the model
+    (such as idx_timestamp_user_id for window rebuilds) that has no index
+    over the same columns yet. Safe to run on every startup.
+    """
+    inspector = inspect(db.engine)
+    columns = {column["name"] for column in inspector.get_columns(Leaderboards.__tablename__)}
+    if "stream_id" not in columns:
+        with db.engine.begin() as connection:
+            connection.execute(text(
+                "ALTER TABLE leaderboards ADD COLUMN stream_id VARCHAR(32) NULL, ADD UNIQUE KEY stream_id (stream_id)"
+            ))
+    
+    indexed = {tuple(index["column_names"]) for index in inspector.get_indexes(Leaderboards.__tablename__)}
+    for index in Leaderboards.__table__.indexes:
+        if tuple(column.name for column in index.columns) not in indexed:
+            index.create(db.engine)
+
 # Create database tables
 with app.app_context():
     db.create_all()
+    upgrade_leaderboards_table()
 
 def add_activity(user_id, calories_burned, activity_type=None, timestamp=None):
     """
@@ -70,4 +122,164 @@ def add_activity(user_id, calories_burned, activity_type=None, timestamp=None):
         return leaderboards
     except Exception as e:
         db.session.rollback()
-        raise
\ No newline at end of file
+        raise
+
+def add_activities(activities, ignore_duplicates=False):
+    """
+    Add many activity records to the database in a single multi-row INSERT
+    
+    Args:
+        activities (list[dict]): Rows with user_id, calories_burned and
+            optional activity_type, timestamp and stream_id
+        ignore_duplicates (bool): Skip rows whose stream_id already exists
+    
+    Returns:
+        int: Number of rows inserted
+    """
+    if not activities:
+        return 0
+    
+    rows = [{
+        "user_id": activity["user_id"],
+        "calories_burned": activity["calories_burned"],
+        "activity_type": activity.get("activity_type"),
+        "timestamp": activity.get("timestamp") or datetime.now(),
+        "stream_id": activity.get("stream_id")
+    } for activity in activities]
+    
+    statement = insert(Leaderboards).values(rows)
+    if ignore_duplicates:
+        statement = statement.prefix_with("IGNORE", dialect="mysql")
+    
+    try:
+        result = db.session.execute(statement)
+        db.session.commit()
+        
+        return result.rowcount
+    except Exception as e:
+        db.session.rollback()
+        raise
+
+def get_existing_stream_ids(stream_ids):
+    """The subset of write-behind stream ids that already have a row in MySQL"""
+    if not stream_ids:
+        return set()
+    return set(db.session.execute(
+        select(Leaderboards.stream_id).where(Leaderboards.stream_id.in_(stream_ids))
+    ).scalars())
+
+def iter_calorie_totals(start=None, end=None, activity_type=None, chunk_size=5000):
+    """
+    Stream SUM(calories_burned) per user for activities in [start, end)
+    
+    The aggregation runs in MySQL, one keyset chunk of users at a time
+    (user_id > last ORDER BY user_id LIMIT chunk_size). mysqlconnector has
+    no server-side cursors, so a single query would buffer every user on
+    the client.
+    
+    Args:
+        start (datetime, optional): Inclusive lower bound on timestamp
+        end (datetime, optional): Exclusive upper bound on timestamp
+        activity_type (str, optional): Only count this activity type
+        chunk_size (int): Users per chunk
+    
+    Yields:
+        list[tuple[str, float]]: Chunks of (user_id, total_calories), in user_id order
+    """
+    query = select(Leaderboards.user_id, func.sum(Leaderboards.calories_burned))
+    if start is not None:
+        query = query.where(Leaderboards.timestamp >= start)
+    if end is not None:
+        query = query.where(Leaderboards.timestamp < end)
+    if activity_type:
+        query = query.where(func.lower(Leaderboards.activity_type) == activity_type.lower())
+    query = query.group_by(Leaderboards.user_id).order_by(Leaderboards.user_id).limit(chunk_size)
+    
+    last_user_id = None
+    while True:
+        chunk_query = query if last_user_id is None else query.where(Leaderboards.user_id > last_user_id)
+        chunk = db.session.execute(chunk_query).all()
+        if not chunk:
+            return
+        yield [(user_id, float(total or 0)) for user_id, total in chunk]
+        if len(chunk) < chunk_size:
+            return
+        last_user_id = chunk[-1][0]
+
+def add_weekly_snapshot(year, week, entries):
+    """
+    Archive one chunk of a finished week's ranking in a single multi-row INSERT
+    
+    Rows already archived for the week are skipped, so an interrupted
+    archive can simply be run again.
+    
+    Args:
+        year (int): ISO year of the week
+        week (int): ISO week number
+        entries (list[tuple[str, float, int]]): (user_id, total, rank) rows
+    
+    Returns:
+        int: Number of rows inserted
+    """
+    if not entries:
+        return 0
+    
+    rows = [{
+        "year": year,
+        "week": week,
+        "user_id": user_id,
+        "total": total,
+        "rank": rank
+    } for user_id, total, rank in entries]
+    
+    statement = insert(WeeklySnapshot).values(rows).prefix_with("IGNORE", dialect="mysql")
+    
+    try:
+        result = db.session.execute(statement)
+        db.session.commit()
+        
+        return result.rowcount
+    except Exception as e:
+        db.session.rollback()
+        raise
+
+def count_weekly_snapshot(year, week):
+    """Number of users archived for a week"""
+    return db.session.execute(
+        select(func.count()).select_from(WeeklySnapshot)
+        .where(WeeklySnapshot.year == year, WeeklySnapshot.week == week)
+    ).scalar()
+
+def get_latest_snapshot_week():
+    """The most recently archived (year, week), or None if nothing is archived yet"""
+    row = db.session.execute(
+        select(WeeklySnapshot.year, WeeklySnapshot.week)
+        .order_by(WeeklySnapshot.year.desc(), WeeklySnapshot.week.desc())
+        .limit(1)
+    ).first()
+    return tuple(row) if row else None
+
+def get_weekly_snapshot(year, week, limit, offset=0):
+    """
+    Get one page of an archived week's ranking
+    
+    Returns:
+        tuple[list[WeeklySnapshot], int]: The page, ordered by rank, and the week's user count
+    """
+    entries = db.session.execute(
+        select(WeeklySnapshot)
+        .where(WeeklySnapshot.year == year, WeeklySnapshot.week == week)
+        .order_by(WeeklySnapshot.rank)
+        .limit(limit)
+        .offset(offset)
+    ).scalars().all()
+    return entries, count_weekly_snapshot(year, week)
+
+def get_user_snapshots(user_id, limit):
+    """A user's archived weekly totals and ranks, most recent week first"""
+    return db.session.execute(
+        select(WeeklySnapshot)
+        .where(WeeklySnapshot.user_id == user_id)
+        .order_by(WeeklySnapshot.year.desc(), WeeklySnapshot.week.desc())
+        .limit(limit)
+    ).scalars().all()
@@ -13,9 +13,23 @@ CREATE TABLE IF NOT EXISTS `leaderboards` (
     calories_burned FLOAT NOT NULL,
     activity_type VARCHAR(255),
     timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-    INDEX (user_id)
+    stream_id VARCHAR(32) UNIQUE,
+    INDEX (user_id),
+    INDEX idx_timestamp_user_id (timestamp, user_id)
 );
 
+-- Final weekly rankings, archived from Redis once a week is over
+DROP TABLE IF EXISTS `weekly_snapshots`;
+CREATE TABLE IF NOT EXISTS `weekly_snapshots` (
+    year SMALLINT NOT NULL,
+    week SMALLINT NOT NULL,
+    user_id VARCHAR(255) NOT NULL,
+    total FLOAT NOT NULL,
+    `rank` INT NOT NULL,
+    PRIMARY KEY (year, week, user_id),
+    INDEX idx_year_week_rank (year, week, `rank`),
+    INDEX idx_user_id_year_week (user_id, year, week)
+);
 
 -- Insert some sample data for testing
 INSERT INTO leaderboards (user_id, calories_burned, activity_type, timestamp) VALUES
@@ -2,47 +2,147 @@ from flask import Flask, request, jsonify
 from flask_cors import CORS
 from datetime import datetime, timedelta
 import os
+import math
+import hashlib
 import logging
 
-from database import app, db, Leaderboards, add_activity
-from cache import LeaderboardCache
+from redis.exceptions import LockError
+
+from database import (
+    app, db, Leaderboards, add_activity, add_activities,
+    get_latest_snapshot_week, get_weekly_snapshot, get_user_snapshots
+)
+from cache import (
+    LeaderboardCache, WINDOWS, ATOMIC_WRITES, FRIENDS_LEADERBOARD_MODE,
+    HISTOGRAM_BUCKET_WIDTH, HISTOGRAM_MAX_BUCKET
+)
+from sweeper import RetentionSweeper
+from rebuild import rebuild_leaderboard, warm_up
+from profiles import ProfileCache, ProfileRefresher, PROFILES_KEY
+from page_cache import PageCache
+from write_behind import WriteBehindFlusher, WRITE_BEHIND_ENABLED, enqueue
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+MAX_BATCH_SIZE = int(os.environ.get("LEADERBOARD_MAX_BATCH_SIZE", 1000))
+MAX_AROUND_RADIUS = 50
+
+profile_refresher = ProfileRefresher()
+page_cache = PageCache()
+write_behind_flusher = WriteBehindFlusher()
+
+def hydrate(entries):
+    """Attach display names to leaderboard entries with a single Redis lookup."""
+    names = ProfileCache.get_names(entry["user_id"] for entry in entries)
+    for entry in entries:
+        entry["name"] = names.get(entry["user_id"])
+    missing = [user_id for user_id, name in names.items() if name is None]
+    if missing:
+        profile_refresher.poke(missing)
+    return entries
+
+def parse_activity(activity_data):
+    """Validate one activity payload before anything is written for it.
+
+    Raises ValueError or TypeError naming the first bad field, so a rejected
+    activity never reaches MySQL, the write-behind stream or Redis.
+    """
+    if not isinstance(activity_data, dict):
+        raise TypeError("Activity must be an object")
+    
+    user_id = activity_data.get("user_id")
+    if not user_id or isinstance(user_id, (dict, list)):
+        raise ValueError("Missing user_id")
+    
+    calories_burned = float(activity_data.get("calories_burned", 0.00))
+    if not math.isfinite(calories_burned):
+        raise ValueError("calories_burned must be a finite number")
+    
+    activity_type = activity_data.get("activity_type", "run")
+    if activity_type is not None and not isinstance(activity_type, str):
+        raise TypeError("activity_type must be a string")
+    
+    friends = activity_data.get("friends")
+    if friends is not None and not (
+        isinstance(friends, list) and all(isinstance(friend, dict) and "Id" in friend for friend in friends)
+    ):
+        raise TypeError('friends must be a list of {"Id": ...} objects')
+    
+    if activity_data.get("timestamp"):
+        timestamp = datetime.fromisoformat(activity_data["timestamp"])
+    else:
+        timestamp = datetime.now()
+    
+    return {
+        "user_id": str(user_id),
+        "calories_burned": calories_burned,
+        "activity_type": activity_type,
+        "friends": friends,
+        "timestamp": timestamp
+    }
+
 @app.route("/leaderboard", methods=["POST"])
 def record_activity():
     """Record a user's fitness activity and update leaderboards."""
     try:
-        activity_data = request.get_json()
-        
-        user_id = activity_data.get("user_id")
-        calories_burned = float(activity_data.get("calories_burned",0.00))
-        activity_type = activity_data.get("activity_type", "run")
-        friends = activity_data.get("friends", [])  
+        # Reject bad input before anything is queued or written
+        try:
+            activity = parse_activity(request.get_json(silent=True))
+        except (TypeError, ValueError) as e:
+            return jsonify({
+                "code": 400,
+                "message": f"Invalid activity: {str(e)}"
+            }), 400
         
-        # Use provided timestamp or current time
-        if "timestamp" in activity_data and activity_data["timestamp"]:
-            timestamp = datetime.fromisoformat(activity_data["timestamp"])
-        else:
-            timestamp = datetime.now()
+        user_id = activity["user_id"]
+        calories_burned = activity["calories_burned"]
+        activity_type = activity["activity_type"]
+        friends = activity["friends"] or []
+        timestamp = activity["timestamp"]
         
-        activity = add_activity(
-            user_id=user_id, 
-            calories_burned=calories_burned, 
-            activity_type=activity_type, 
-            timestamp=timestamp
-        )
+        # In write-behind mode the MySQL row is buffered and inserted by a background flusher
+        stream_ids = None
+        if WRITE_BEHIND_ENABLED:
+            stream_ids = enqueue([{
+                "user_id": user_id,
+                "calories_burned": calories_burned,
+                "activity_type": activity_type,
+                "timestamp": timestamp
+            }])
         
-        # Update Redis weekly leaderboard
-        LeaderboardCache.update_leaderboards(user_id, calories_burned, timestamp)
+        if stream_ids is None:
+            activity = add_activity(
+                user_id=user_id, 
+                calories_burned=calories_burned, 
+                activity_type=activity_type, 
+                timestamp=timestamp
+            )
         
-        # Update friends leaderboards with provided friends list
-        LeaderboardCache.update_friends_leaderboard(user_id, friends)
+        if ATOMIC_WRITES and FRIENDS_LEADERBOARD_MODE == "fanout":
+            # Boards, TTLs and friends fanout in one server-side script call
+            LeaderboardCache.update_leaderboards_atomic(user_id, calories_burned, friends, activity_type, timestamp)
+        else:
+            # Update Redis daily, weekly, monthly and all-time leaderboards
+            LeaderboardCache.update_leaderboards(user_id, calories_burned, timestamp, activity_type)
+            
+            # Update friends leaderboards with provided friends list
+            LeaderboardCache.update_friends_leaderboard(user_id, friends)
         
-        # Clean up any old data
-        LeaderboardCache.clear_old_data()
+        if stream_ids:
+            return jsonify({
+                "code": 202,
+                "message": "Activity recorded, database write queued",
+                "data": {
+                    "id": None,
+                    "stream_id": stream_ids[0],
+                    "user_id": user_id,
+                    "calories_burned": calories_burned,
+                    "activity_type": activity_type,
+                    "timestamp": timestamp.isoformat()
+                }
+            }), 202
         
         return jsonify({
             "code": 201,
@@ -56,41 +156,364 @@ def record_activity():
             "message": f"Error recording activity: {str(e)}"
         }), 500
 
-@app.route("/leaderboard/weekly")
-def get_weekly_leaderboard():
-    """Get the current week's leaderboard."""
+@app.route("/leaderboard/batch", methods=["POST"])
+def record_activities():
+    """Record many activities at once with one INSERT and one Redis pipeline."""
+    try:
+        payload = request.get_json(silent=True)
+        activities = payload.get("activities") if isinstance(payload, dict) else payload
+        
+        if not isinstance(activities, list) or not activities:
+            return jsonify({
+                "code": 400,
+                "message": "Request body must contain a non-empty list of activities"
+            }), 400
+        
+        if len(activities) > MAX_BATCH_SIZE:
+            return jsonify({
+                "code": 413,
+                "message": f"Batch too large: at most {MAX_BATCH_SIZE} activities per request"
+            }), 413
+        
+        results = []
+        rows = []
+        increments = {}
+        friends_by_user = {}
+        
+        for index, activity_data in enumerate(activities):
+            try:
+                activity = parse_activity(activity_data)
+            except (TypeError, ValueError) as e:
+                results.append({"index": index, "code": 400, "message": str(e)})
+                continue
+            
+            user_id = activity["user_id"]
+            activity_type = activity["activity_type"]
+            rows.append({
+                "user_id": user_id,
+                "calories_burned": activity["calories_burned"],
+                "activity_type": activity_type,
+                "timestamp": activity["timestamp"]
+            })
+            # Aggregated per day, since an activity only counts towards the windows open on its own day
+            key = (user_id, activity_type, activity["timestamp"].date())
+            increments[key] = increments.get(key, 0.0) + activity["calories_burned"]
+            if "friends" in activity_data:
+                friends_by_user[user_id] = activity["friends"] or []
+            results.append({"index": index, "code": 201, "user_id": user_id})
+        
+        if rows:
+            if not (WRITE_BEHIND_ENABLED and enqueue(rows) is not None):
+                add_activities(rows)
+            
+            # One ZINCRBY per user, activity type, day and board, however many activities are in the batch
+            LeaderboardCache.update_leaderboards_bulk(increments)
+            
+            for user_id, friends in friends_by_user.items():
+                LeaderboardCache.update_friends_leaderboard(user_id, friends)
+        
+        recorded = len(rows)
+        failed = len(results) - recorded
+        if failed == 0:
+            code = 201
+        elif recorded == 0:
+            code = 400
+        else:
+            code = 207
+        
+        return jsonify({
+            "code": code,
+            "message": f"Recorded {recorded} activities, {failed} failed",
+            "data": {
+                "recorded": recorded,
+                "failed": failed,
+                "results": results
+            }
+        }), code
+    except Exception as e:
+        logger.error(f"Error recording activities: {str(e)}")
+        return jsonify({
+            "code": 500,
+            "message": f"Error recording activities: {str(e)}"
+        }), 500
+
+def get_time_period(window):
+    """Human-readable label for the period a window's current leaderboard covers."""
+    today = datetime.now()
+    if window == "daily":
+        return today.strftime("%d %B %Y")
+    if window == "weekly":
+        year, week_number = LeaderboardCache.get_iso_week(today)
+        return f"Week {week_number}, {year}"
+    if window == "monthly":
+        return today.strftime("%B %Y")
+    return "All time"
+
+@app.route("/leaderboard/history")
+def get_leaderboard_history():
+    """Get a finished week's final leaderboard from the MySQL snapshot (latest archived week by default)."""
     try:
         limit = int(request.args.get("limit", 10))
         offset = int(request.args.get("offset", 0))
         
-        weekly_key = LeaderboardCache.get_weekly_leaderboard_key()
-        leaderboard_data, total_users = LeaderboardCache.get_leaderboard(weekly_key, limit, offset)
+        if "year" in request.args and "week" in request.args:
+            year, week = int(request.args["year"]), int(request.args["week"])
+        else:
+            latest = get_latest_snapshot_week()
+            if latest is None:
+                return jsonify({
+                    "code": 404,
+                    "message": "No archived weeks yet"
+                }), 404
+            year, week = latest
+        
+        snapshot, total_users = get_weekly_snapshot(year, week, limit, offset)
+        if total_users == 0:
+            return jsonify({
+                "code": 404,
+                "message": f"No archived leaderboard for week {week}, {year}"
+            }), 404
+        
+        entries = [{
+            "user_id": entry.user_id,
+            "calories_burned": entry.total,
+            "rank": entry.rank
+        } for entry in snapshot]
+        
+        response = jsonify({
+            "code": 200,
+            "data": {
+                "entries": hydrate(entries),
+                "total_users": total_users,
+                "year": year,
+                "week": week,
+                "time_period": f"Week {week}, {year}"
+            }
+        })
+        # A finished week never changes once archived
+        if "year" in request.args and "week" in request.args:
+            response.headers["Cache-Control"] = "public, max-age=86400"
+        return response
+    except Exception as e:
+        logger.error(f"Error getting leaderboard history: {str(e)}")
+        return jsonify({
+            "code": 500,
+            "message": f"Error getting leaderboard history: {str(e)}"
+        }), 500
+
+@app.route("/leaderboard/history/<user_id>")
+def get_user_history(user_id):
+    """Get a user's final total and rank for each archived week, most recent first."""
+    try:
+        limit = int(request.args.get("limit", 12))
+        
+        weeks = [snapshot.json() for snapshot in get_user_snapshots(user_id, limit)]
+        
+        return jsonify({
+            "code": 200,
+            "data": {
+                "user_id": user_id,
+                "weeks": weeks
+            }
+        })
+    except Exception as e:
+        logger.error(f"Error getting history for user {user_id}: {str(e)}")
+        return jsonify({
+            "code": 500,
+            "message": f"Error getting history for user {user_id}: {str(e)}"
+        }), 500
+
+@app.route("/leaderboard/weekly", defaults={"window": "weekly"})
+@app.route("/leaderboard/<window>")
+def get_window_leaderboard(window):
+    """Get the current daily, weekly, monthly or all-time leaderboard, optionally for one activity type."""
+    if window not in WINDOWS:
+        return jsonify({
+            "code": 404,
+            "message": f"Unknown leaderboard window: {window}"
+        }), 404
+    
+    try:
+        limit = int(request.args.get("limit", 10))
+        offset = int(request.args.get("offset", 0))
+        activity_type = request.args.get("activity_type")
+        
+        leaderboard_key = LeaderboardCache.get_leaderboard_key(window, activity_type)
+        
+        # The page only changes when the board or the display names are written
+        versions = LeaderboardCache.get_versions([leaderboard_key, PROFILES_KEY])
+        etag = hashlib.sha1(f"{leaderboard_key}:{versions}:{limit}:{offset}".encode()).hexdigest()[:20]
+        
+        if request.if_none_match.contains(etag):
+            response = app.response_class(status=304)
+        else:
+            body = page_cache.get(etag)
+            if body is None:
+                leaderboard_data, total_users = LeaderboardCache.get_leaderboard(leaderboard_key, limit, offset)
+                
+                entries = []
+                for rank, (user_id, calories) in enumerate(leaderboard_data, start=offset + 1):
+                    entries.append({
+                        "user_id": user_id,
+                        "calories_burned": float(calories),
+                        "rank": rank
+                    })
+                
+                data = {
+                    "entries": hydrate(entries),
+                    "total_users": total_users,
+                    "time_period": get_time_period(window)
+                }
+                if activity_type:
+                    data["activity_type"] = activity_type
+                
+                body = jsonify({
+                    "code": 200,
+                    "data": data
+                }).get_data()
+                page_cache.put(etag, body)
+            response = app.response_class(body, mimetype="application/json")
+        
+        response.set_etag(etag)
+        response.headers["Cache-Control"] = "no-cache"
+        return response
+    except Exception as e:
+        logger.error(f"Error getting {window} leaderboard: {str(e)}")
+        return jsonify({
+            "code": 500,
+            "message": f"Error getting {window} leaderboard: {str(e)}"
+        }), 500
+
+@app.route("/leaderboard/<window>/around/<user_id>")
+def get_rank_around(window, user_id):
+    """Get a user's rank and score with the N entries above and below them."""
+    if window not in WINDOWS:
+        return jsonify({
+            "code": 404,
+            "message": f"Unknown leaderboard window: {window}"
+        }), 404
+    
+    try:
+        radius = max(0, min(int(request.args.get("n", 5)), MAX_AROUND_RADIUS))
+        activity_type = request.args.get("activity_type")
+        
+        leaderboard_key = LeaderboardCache.get_leaderboard_key(window, activity_type)
+        rank, total_users, neighbours = LeaderboardCache.get_rank_around(user_id, leaderboard_key, radius)
+        
+        if rank is None:
+            return jsonify({
+                "code": 404,
+                "message": f"User {user_id} is not on the {window} leaderboard",
+                "data": {"total_users": total_users}
+            }), 404
         
         entries = []
-        for rank, (user_id, calories) in enumerate(leaderboard_data, start=offset + 1):
+        calories_burned = None
+        for entry_user_id, calories, entry_rank in neighbours:
             entries.append({
+                "user_id": entry_user_id,
+                "calories_burned": calories,
+                "rank": entry_rank
+            })
+            if entry_rank == rank:
+                calories_burned = calories
+        
+        return jsonify({
+            "code": 200,
+            "data": {
                 "user_id": user_id,
-                "calories_burned": float(calories),
-                "rank": rank
+                "rank": rank,
+                "calories_burned": calories_burned,
+                "entries": hydrate(entries),
+                "total_users": total_users,
+                "time_period": get_time_period(window)
+            }
+        })
+    except Exception as e:
+        logger.error(f"Error getting rank around user: {str(e)}")
+        return jsonify({
+            "code": 500,
+            "message": f"Error getting rank around user: {str(e)}"
+        }), 500
+
+def estimate_standing(buckets, score):
+    """Estimate how many users are ahead of a score from bucket counts.
+
+    Users in higher buckets are ahead; within the score's own bucket, scores
+    are assumed to be spread evenly across the bucket's width.
+    """
+    bucket = LeaderboardCache.get_bucket(score)
+    ahead = sum(count for index, count in buckets.items() if index > bucket)
+    in_bucket = buckets.get(bucket, 0)
+    if bucket < HISTOGRAM_MAX_BUCKET:
+        position = (score - bucket * HISTOGRAM_BUCKET_WIDTH) / HISTOGRAM_BUCKET_WIDTH
+        ahead += max(in_bucket - 1, 0) * (1 - min(max(position, 0.0), 1.0))
+    return ahead
+
+@app.route("/leaderboard/weekly/distribution")
+def get_weekly_distribution():
+    """Get the bucketed distribution of this week's calorie totals."""
+    try:
+        weekly_key = LeaderboardCache.get_weekly_leaderboard_key()
+        buckets, _ = LeaderboardCache.get_distribution(weekly_key)
+        
+        histogram = []
+        for index in sorted(buckets):
+            histogram.append({
+                "min_calories": index * HISTOGRAM_BUCKET_WIDTH,
+                "max_calories": None if index == HISTOGRAM_MAX_BUCKET else (index + 1) * HISTOGRAM_BUCKET_WIDTH,
+                "users": buckets[index]
             })
         
-        today = datetime.now()
-        week_number = today.isocalendar()[1]
-        time_period = f"Week {week_number}, {today.year}"
+        return jsonify({
+            "code": 200,
+            "data": {
+                "bucket_width": HISTOGRAM_BUCKET_WIDTH,
+                "buckets": histogram,
+                "total_users": sum(buckets.values()),
+                "time_period": get_time_period("weekly")
+            }
+        })
+    except Exception as e:
+        logger.error(f"Error getting weekly distribution: {str(e)}")
+        return jsonify({
+            "code": 500,
+            "message": f"Error getting weekly distribution: {str(e)}"
+        }), 500
+
+@app.route("/leaderboard/weekly/percentile/<user_id>")
+def get_weekly_percentile(user_id):
+    """Get a user's approximate standing ("top 12%") on this week's board."""
+    try:
+        weekly_key = LeaderboardCache.get_weekly_leaderboard_key()
+        buckets, score = LeaderboardCache.get_distribution(weekly_key, user_id)
+        total_users = sum(buckets.values())
+        
+        if score is None or total_users == 0:
+            return jsonify({
+                "code": 404,
+                "message": f"User {user_id} is not on the weekly leaderboard"
+            }), 404
+        
+        ahead = estimate_standing(buckets, score)
+        top_percent = min(100.0, (ahead + 1) / total_users * 100)
         
         return jsonify({
             "code": 200,
             "data": {
-                "entries": entries,
+                "user_id": user_id,
+                "calories_burned": score,
+                "top_percent": round(top_percent, 1),
+                "percentile": round(100 - top_percent, 1),
                 "total_users": total_users,
-                "time_period": time_period
+                "time_period": get_time_period("weekly")
             }
         })
     except Exception as e:
-        logger.error(f"Error getting weekly leaderboard: {str(e)}")
+        logger.error(f"Error getting weekly percentile: {str(e)}")
         return jsonify({
             "code": 500,
-            "message": f"Error getting weekly leaderboard: {str(e)}"
+            "message": f"Error getting weekly percentile: {str(e)}"
         }), 500
 
 @app.route("/leaderboard/friends/<user_id>")
@@ -99,8 +522,7 @@ def get_friends_leaderboard(user_id):
     try:
         limit = int(request.args.get("limit", 10))
         
-        friends_key = LeaderboardCache.get_friends_leaderboard_key(user_id)
-        leaderboard_data, total_users = LeaderboardCache.get_leaderboard(friends_key, limit, 0)
+        leaderboard_data, total_users = LeaderboardCache.get_friends_leaderboard(user_id, limit)
         
         entries = []
         for rank, (friend_id, calories) in enumerate(leaderboard_data, start=1):
@@ -113,7 +535,7 @@ def get_friends_leaderboard(user_id):
         return jsonify({
             "code": 200,
             "data": {
-                "entries": entries,
+                "entries": hydrate(entries),
                 "total_users": total_users
             }
         })
@@ -124,5 +546,67 @@ def get_friends_leaderboard(user_id):
             "message": f"Error getting friends leaderboard: {str(e)}"
         }), 500
 
+@app.route("/leaderboard/admin/rebuild", methods=["POST"])
+def admin_rebuild_leaderboard():
+    """Rebuild a window's current leaderboard in Redis from MySQL (weekly by default)."""
+    window = request.args.get("window", "weekly")
+    if window not in WINDOWS:
+        return jsonify({
+            "code": 404,
+            "message": f"Unknown leaderboard window: {window}"
+        }), 404
+    
+    try:
+        activity_type = request.args.get("activity_type")
+        chunk_size = request.args.get("chunk_size", type=int)
+        try:
+            loaded = rebuild_leaderboard(window, activity_type, chunk_size)
+        except LockError:
+            return jsonify({
+                "code": 409,
+                "message": "Another leaderboard rebuild is in progress, try again later"
+            }), 409
+        
+        return jsonify({
+            "code": 200,
+            "message": f"{window.capitalize()} leaderboard rebuilt",
+            "data": {
+                "key": LeaderboardCache.get_leaderboard_key(window, activity_type),
+                "users_loaded": loaded
+            }
+        })
+    except Exception as e:
+        logger.error(f"Error rebuilding leaderboard: {str(e)}")
+        return jsonify({
+            "code": 500,
+            "message": f"Error rebuilding leaderboard: {str(e)}"
+        }), 500
+
+@app.route("/leaderboard/admin/write-behind")
+def write_behind_stats():
+    """Report the write-behind buffer's backlog and flush lag."""
+    try:
+        return jsonify({
+            "code": 200,
+            "data": write_behind_flusher.stats()
+        })
+    except Exception as e:
+        logger.error(f"Error getting write-behind stats: {str(e)}")
+        return jsonify({
+            "code": 500,
+            "message": f"Error getting write-behind stats: {str(e)}"
+        }), 500
+
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5005, debug=True)
\ No newline at end of file
+    debug = True
+    # The debug reloader runs this module in a watcher process too; only the serving child starts background work
+    if not debug or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        # Repopulate Redis from MySQL if it restarted or was flushed
+        warm_up()
+        # Old weeks are archived to MySQL and cleaned up in the background instead of on every write
+        RetentionSweeper().start()
+        # Display names are kept in Redis so reads can hydrate entries in one lookup
+        profile_refresher.start()
+        # Always drain the buffer, so entries queued before write-behind was switched off still land
+        write_behind_flusher.start()
+    app.run(host="0.0.0.0", port=5005, debug=debug)
\ No newline at end of file
@@ -0,0 +1,30 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+class PageCache:
+    """Process-local LRU of rendered leaderboard pages, keyed by ETag.
+
+    ETags are derived from leaderboard write versions, so entries never need
+    invalidating: a write changes the ETag and old pages simply age out.
+    """
+
+    def __init__(self, max_entries: int = None):
+        self.max_entries = max_entries or int(os.environ.get("LEADERBOARD_PAGE_CACHE_SIZE", 512))
+        self._pages = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, etag: str) -> Optional[bytes]:
+        with self._lock:
+            body = self._pages.get(etag)
+            if body is not None:
+                self._pages.move_to_end(etag)
+            return body
+
+    def put(self, etag: str, body: bytes):
+        with self._lock:
+            self._pages[etag] = body
+            self._pages.move_to_end(etag)
+            while len(self._pages) > self.max_entries:
+                self._pages.popitem(last=False)
@@ -0,0 +1,151 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+import time
+import uuid
+from typing import Dict, Iterable, Optional
+
+import requests
+
+from cache import LeaderboardCache, get_redis
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+USER_SERVICE_URL = os.environ.get("USER_SERVICE_URL", "http://user-service:5000/user")
+PROFILES_KEY = "leaderboard:profiles"
+PROFILES_TTL = 60 * 60 * 24  # 1 day
+PROFILE_PAGE_SIZE = int(os.environ.get("PROFILE_PAGE_SIZE", 1000))
+
+class ProfileCache:
+    """Redis projection of the user display data needed to render leaderboards."""
+
+    @staticmethod
+    def get_names(user_ids: Iterable[str]) -> Dict[str, Optional[str]]:
+        """Get display names for many users with one HMGET; unknown users map to None."""
+        user_ids = list(dict.fromkeys(user_ids))
+        if not user_ids:
+            return {}
+        names = get_redis().hmget(PROFILES_KEY, user_ids)
+        return dict(zip(user_ids, names))
+
+    @staticmethod
+    def refresh(timeout: float = 10) -> int:
+        """Reload every user's display name from the User service in bulk.
+
+        Users are walked page by page into a staging hash, which is swapped in
+        with RENAME, so readers never see it half-loaded and deleted users drop
+        out. Memory stays bounded by the page size.
+        """
+        redis = get_redis()
+        staging_key = f"{PROFILES_KEY}:staging:{uuid.uuid4().hex}"
+        # Names are part of rendered pages: derive the version from the content so
+        # a refresh only invalidates cached pages when some name actually changed
+        digest = hashlib.sha1()
+        loaded = 0
+        after = None
+        try:
+            while True:
+                params = {"limit": PROFILE_PAGE_SIZE}
+                if after:
+                    params["after"] = after
+                response = requests.get(USER_SERVICE_URL, params=params, timeout=timeout)
+                response.raise_for_status()
+                page = response.json().get("data", {})
+
+                names = {str(user["userId"]): user.get("name") or str(user["userId"]) for user in page.get("users", [])}
+                if names:
+                    with redis.pipeline(transaction=False) as pipe:
+                        pipe.hset(staging_key, mapping=names)
+                        pipe.expire(staging_key, PROFILES_TTL)
+                        pipe.execute()
+                    digest.update(json.dumps(list(names.items())).encode())
+                    loaded += len(names)
+
+                after = page.get("next_cursor")
+                if not after:
+                    break
+
+            with redis.pipeline(transaction=True) as pipe:
+                if loaded:
+                    pipe.rename(staging_key, PROFILES_KEY)
+                    pipe.expire(PROFILES_KEY, PROFILES_TTL)
+                else:
+                    pipe.delete(PROFILES_KEY)
+                pipe.set(LeaderboardCache.get_version_key(PROFILES_KEY), int(digest.hexdigest()[:12], 16), ex=PROFILES_TTL)
+                pipe.execute()
+        finally:
+            redis.delete(staging_key)
+
+        logger.info(f"Refreshed {loaded} user profiles")
+        return loaded
+
+    @staticmethod
+    def load(user_ids: Iterable[str], timeout: float = 10) -> int:
+        """Add specific users to the projection with one batch lookup against the User service."""
+        user_ids = list(dict.fromkeys(user_ids))
+        if not user_ids:
+            return 0
+        response = requests.get(USER_SERVICE_URL, params={"ids": ",".join(user_ids)}, timeout=timeout)
+        response.raise_for_status()
+        users = response.json().get("data", {}).get("users", {})
+
+        names = {str(user_id): user.get("name") or str(user_id) for user_id, user in users.items()}
+        if names:
+            with get_redis().pipeline(transaction=True) as pipe:
+                pipe.hset(PROFILES_KEY, mapping=names)
+                pipe.expire(PROFILES_KEY, PROFILES_TTL)
+                # New names change rendered pages
+                pipe.incr(LeaderboardCache.get_version_key(PROFILES_KEY))
+                pipe.execute()
+
+        logger.info(f"Loaded {len(names)} of {len(user_ids)} missing user profiles")
+        return len(names)
+
+class ProfileRefresher(threading.Thread):
+    """Background thread that keeps the profile projection fresh.
+
+    Reloads every profile on a schedule. Users a read found missing are
+    fetched early (at most once per min_interval) with a batch lookup of just
+    those ids.
+    """
+
+    def __init__(self, interval: float = None, min_interval: float = None):
+        super().__init__(name="leaderboard-profile-refresher", daemon=True)
+        self.interval = interval or float(os.environ.get("PROFILE_REFRESH_INTERVAL", 300))
+        self.min_interval = min_interval or float(os.environ.get("PROFILE_REFRESH_MIN_INTERVAL", 30))
+        self._wakeup = threading.Event()
+        self._missing = set()
+        self._missing_lock = threading.Lock()
+
+    def run(self):
+        logger.info(f"Profile refresher started (every {self.interval}s)")
+        next_refresh = 0.0
+        while True:
+            self._wakeup.clear()
+            try:
+                if time.monotonic() >= next_refresh:
+                    next_refresh = time.monotonic() + self.interval
+                    self._take_missing()  # covered by the full reload
+                    ProfileCache.refresh()
+                else:
+                    ProfileCache.load(self._take_missing())
+            except Exception as e:
+                logger.error(f"Profile refresh failed: {str(e)}")
+            # Never refresh more often than min_interval, even if poked
+            time.sleep(self.min_interval)
+            self._wakeup.wait(max(next_refresh - time.monotonic(), 0))
+
+    def poke(self, user_ids: Iterable[str] = ()):
+        """Ask for an early lookup of users a read found missing from the projection."""
+        with self._missing_lock:
+            self._missing.update(user_ids)
+        self._wakeup.set()
+
+    def _take_missing(self):
+        with self._missing_lock:
+            missing, self._missing = self._missing, set()
+        return missing
@@ -0,0 +1,72 @@
+import os
+import logging
+
+from redis.exceptions import LockError
+
+from database import app, iter_calorie_totals
+from cache import LeaderboardCache, get_redis, WINDOWS, WINDOW_TTLS
+from write_behind import STREAM_KEY, pause_flushes, pending_increments
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+REBUILD_CHUNK_SIZE = int(os.environ.get("LEADERBOARD_REBUILD_CHUNK_SIZE", 5000))
+# How long a rebuild waits for the write-behind lock before giving up
+REBUILD_LOCK_WAIT = float(os.environ.get("LEADERBOARD_REBUILD_LOCK_WAIT", 10))
+
+def rebuild_leaderboard(window: str = "weekly", activity_type: str = None, chunk_size: int = None,
+                        lock_wait: float = None) -> int:
+    """Rebuild a window's current Redis leaderboard from the durable MySQL table.
+
+    Per-user totals are aggregated in MySQL and streamed into Redis chunk by
+    chunk, so memory stays bounded no matter how many activity rows exist.
+
+    Nothing written meanwhile is lost. The write-behind flusher is paused,
+    and buffered activities not yet in MySQL are added on top. Writers
+    record increments made during the rebuild in a delta that is merged in
+    at the swap. An activity in flight at the instant the rebuild starts can
+    be counted twice.
+
+    Raises LockError if another rebuild still holds the write-behind lock
+    after lock_wait seconds (REBUILD_LOCK_WAIT by default).
+    """
+    chunk_size = chunk_size or REBUILD_CHUNK_SIZE
+    leaderboard_key = LeaderboardCache.get_leaderboard_key(window, activity_type)
+    start, end = LeaderboardCache.get_window_range(window)
+
+    lock_wait = REBUILD_LOCK_WAIT if lock_wait is None else lock_wait
+    with pause_flushes(lock_wait), app.app_context():
+        last_id = LeaderboardCache.begin_rebuild(leaderboard_key, STREAM_KEY)
+        loaded = LeaderboardCache.load_leaderboard(
+            leaderboard_key,
+            iter_calorie_totals(start, end, activity_type, chunk_size),
+            ttl=WINDOW_TTLS[window],
+            with_histogram=(window == "weekly" and not activity_type),
+            pending=pending_increments(last_id, start, end, activity_type)
+        )
+
+    logger.info(f"Rebuilt {leaderboard_key} with {loaded} users")
+    return loaded
+
+def warm_up():
+    """Rebuild any overall window leaderboard that Redis has lost, on startup.
+
+    If the write-behind lock is held (say, by a process that died
+    mid-rebuild) the warm-up stops rather than holding up startup; rebuild
+    the missing boards later through /leaderboard/admin/rebuild.
+    """
+    rebuilt = 0
+    for window in WINDOWS:
+        try:
+            leaderboard_key = LeaderboardCache.get_leaderboard_key(window)
+            if get_redis().exists(leaderboard_key):
+                continue
+            logger.info(f"{leaderboard_key} missing from Redis, rebuilding from MySQL")
+            rebuilt += rebuild_leaderboard(window)
+        except LockError:
+            logger.warning("Skipping leaderboard warm-up: another rebuild holds the write-behind lock")
+            break
+        except Exception as e:
+            logger.error(f"Leaderboard warm-up failed for {window}: {str(e)}")
+    return rebuilt
@@ -0,0 +1,108 @@
+"""
+Concurrency stress test for the LeaderboardCache write path.
+
+A group of users who are all friends with each other log activities from
+many threads at once. Afterwards every weekly total must equal the sum of
+that user's increments, and every friends board must hold each friend's
+final weekly total. The pipelined path (a ZMSCORE read followed by a
+MULTI write) can interleave with other writers and leave stale friend
+totals behind; the atomic script path must never do so.
+
+Requires a reachable Redis (REDIS_HOST / REDIS_PORT). The test runs in a
+scratch logical database (--db, default 15) which is flushed before and after.
+
+    python stress_cache.py --users 20 --threads 16 --writes 200
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+from collections import Counter
+
+from redis import Redis, ConnectionPool
+
+import cache
+from cache import LeaderboardCache
+
+def pipelined_write(user_id, calories_burned, friends):
+    LeaderboardCache.update_leaderboards(user_id, calories_burned)
+    LeaderboardCache.update_friends_leaderboard(user_id, friends)
+
+def atomic_write(user_id, calories_burned, friends):
+    LeaderboardCache.update_leaderboards_atomic(user_id, calories_burned, friends)
+
+def run(name, write, args, redis):
+    users = [f"stress-user-{i}" for i in range(args.users)]
+    expected = Counter()
+    lock = threading.Lock()
+    start = threading.Barrier(args.threads)
+
+    def worker(seed):
+        rng = random.Random(seed)
+        local = Counter()
+        start.wait()
+        for _ in range(args.writes):
+            user_id = rng.choice(users)
+            calories_burned = rng.randint(1, 500)
+            friends = [{"Id": friend_id} for friend_id in users if friend_id != user_id]
+            write(user_id, calories_burned, friends)
+            local[user_id] += calories_burned
+        with lock:
+            expected.update(local)
+
+    threads = [threading.Thread(target=worker, args=(seed,)) for seed in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    weekly_key = LeaderboardCache.get_weekly_leaderboard_key()
+    weekly = dict(redis.zrange(weekly_key, 0, -1, withscores=True))
+
+    wrong_totals = [user_id for user_id in expected if weekly.get(user_id) != float(expected[user_id])]
+
+    stale_entries = 0
+    for user_id in users:
+        board = dict(redis.zrange(LeaderboardCache.get_friends_leaderboard_key(user_id), 0, -1, withscores=True))
+        for member, score in board.items():
+            if score != weekly.get(member, 0.0):
+                stale_entries += 1
+
+    writes = args.threads * args.writes
+    print(f"{name:<10} writes={writes}  wrong_weekly_totals={len(wrong_totals)}  stale_friend_entries={stale_entries}")
+    return not wrong_totals and stale_entries == 0
+
+def main():
+    parser = argparse.ArgumentParser(description="Stress concurrent LeaderboardCache writes")
+    parser.add_argument("--users", type=int, default=20, help="users in the friend group")
+    parser.add_argument("--threads", type=int, default=16, help="concurrent writers")
+    parser.add_argument("--writes", type=int, default=200, help="writes per thread")
+    parser.add_argument("--db", type=int, default=15, help="scratch Redis database to use")
+    args = parser.parse_args()
+
+    connection_kwargs = {
+        "host": os.environ.get("REDIS_HOST", "localhost"),
+        "port": int(os.environ.get("REDIS_PORT", 6379)),
+        "password": os.environ.get("REDIS_PASSWORD", ""),
+        "db": args.db,
+        "decode_responses": True
+    }
+    cache._pool = ConnectionPool(max_connections=args.threads * 2, **connection_kwargs)
+    cache.FRIENDS_LEADERBOARD_MODE = "fanout"
+    redis = Redis(**connection_kwargs)
+
+    try:
+        redis.flushdb()
+        run("pipelined", pipelined_write, args, redis)
+        redis.flushdb()
+        atomic_ok = run("atomic", atomic_write, args, redis)
+    finally:
+        redis.flushdb()
+        redis.close()
+
+    # Only the atomic path guarantees consistency under concurrency
+    sys.exit(0 if atomic_ok else 1)
+
+if __name__ == "__main__":
+    main()
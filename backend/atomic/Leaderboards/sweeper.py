@@ -0,0 +1,42 @@
+import os
+import logging
+import threading
+
+from cache import LeaderboardCache
+from archive import archive_finished_weeks
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class RetentionSweeper(threading.Thread):
+    """Background thread that periodically archives past weeks' leaderboards and removes them from Redis."""
+
+    def __init__(self, interval: float = None, batch_size: int = None):
+        super().__init__(name="leaderboard-retention-sweeper", daemon=True)
+        self.interval = interval or float(os.environ.get("LEADERBOARD_SWEEP_INTERVAL", 300))
+        self.batch_size = batch_size or int(os.environ.get("LEADERBOARD_SWEEP_BATCH_SIZE", 500))
+        self._stopped = threading.Event()
+
+    def run(self):
+        logger.info(f"Retention sweeper started (every {self.interval}s, batches of {self.batch_size})")
+        while not self._stopped.is_set():
+            self.sweep()
+            self._stopped.wait(self.interval)
+
+    def sweep(self):
+        """Run a single retention pass; errors are logged and retried on the next tick."""
+        try:
+            # Past weeks are only deleted once their final ranking is safely in MySQL
+            archive_finished_weeks(self.batch_size)
+        except Exception as e:
+            logger.error(f"Weekly archive failed, keeping past weeks in Redis: {str(e)}")
+            return 0
+        try:
+            return LeaderboardCache.clear_old_data(self.batch_size)
+        except Exception as e:
+            logger.error(f"Retention sweep failed: {str(e)}")
+            return 0
+
+    def stop(self):
+        self._stopped.set()
@@ -0,0 +1,275 @@
+import os
+import math
+import socket
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from redis.exceptions import ResponseError
+from sqlalchemy.exc import InterfaceError, OperationalError
+
+from database import app, add_activities, get_existing_stream_ids
+from cache import get_redis, REBUILD_TTL
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+WRITE_BEHIND_ENABLED = os.environ.get("LEADERBOARD_WRITE_BEHIND", "false").lower() == "true"
+MAX_BACKLOG = int(os.environ.get("LEADERBOARD_WRITE_BEHIND_MAX_BACKLOG", 100000))
+
+STREAM_KEY = "leaderboard:activity-stream"
+GROUP = "leaderboard-writers"
+# Entries MySQL rejected (or that could not be parsed), kept for inspection instead of blocking the stream
+DEAD_LETTER_KEY = "leaderboard:activity-stream:dead"
+
+# Held around every flush, and by a rebuild while it reads MySQL and the backlog
+FLUSH_LOCK_KEY = "leaderboard:write-behind:lock"
+FLUSH_LOCK_TIMEOUT = 5 * 60
+
+def flush_lock(timeout: int = FLUSH_LOCK_TIMEOUT, blocking_timeout: Optional[float] = None):
+    """Get the lock that keeps buffered rows from reaching MySQL while it is held."""
+    return get_redis().lock(FLUSH_LOCK_KEY, timeout=timeout, blocking_timeout=blocking_timeout)
+
+def pause_flushes(blocking_timeout: Optional[float] = None):
+    """Lock out the flusher for the length of a leaderboard rebuild.
+
+    Entering the lock raises LockError if it is still held by someone else
+    after blocking_timeout seconds (None waits indefinitely).
+    """
+    return flush_lock(REBUILD_TTL, blocking_timeout)
+
+def parse_entry(stream_id: str, fields: Dict) -> Dict:
+    """Turn a stream entry back into an activity row; raises on a malformed entry."""
+    calories_burned = float(fields["calories_burned"])
+    if not math.isfinite(calories_burned):
+        raise ValueError(f"calories_burned is not finite: {fields['calories_burned']}")
+    return {
+        "user_id": fields["user_id"],
+        "calories_burned": calories_burned,
+        "activity_type": fields.get("activity_type") or None,
+        "timestamp": datetime.fromisoformat(fields["timestamp"]),
+        "stream_id": stream_id
+    }
+
+def pending_increments(last_id: Optional[str], start: Optional[datetime] = None, end: Optional[datetime] = None,
+                       activity_type: Optional[str] = None, chunk_size: int = 1000) -> Dict[str, float]:
+    """Sum, per user, the buffered calories up to last_id that are not in MySQL yet.
+
+    Only entries with a timestamp in [start, end) and, if given, of the
+    activity type are counted, matching iter_calorie_totals. Call it with
+    the flusher paused and inside an app context.
+    """
+    totals = {}
+    if last_id is None:
+        return totals
+    
+    redis = get_redis()
+    cursor = "-"
+    while True:
+        entries = redis.xrange(STREAM_KEY, min=cursor, max=last_id, count=chunk_size)
+        if not entries:
+            break
+        # Entries whose flush committed but was never acknowledged are already in MySQL
+        flushed = get_existing_stream_ids([stream_id for stream_id, _ in entries])
+        for stream_id, fields in entries:
+            if stream_id in flushed:
+                continue
+            try:
+                row = parse_entry(stream_id, fields)
+            except (KeyError, TypeError, ValueError):
+                continue
+            if start is not None and row["timestamp"] < start:
+                continue
+            if end is not None and row["timestamp"] >= end:
+                continue
+            if activity_type and (row["activity_type"] or "").lower() != activity_type.lower():
+                continue
+            totals[row["user_id"]] = totals.get(row["user_id"], 0.0) + row["calories_burned"]
+        if len(entries) < chunk_size:
+            break
+        cursor = "(" + entries[-1][0]
+    return totals
+
+def enqueue(activities: List[Dict]) -> Optional[List[str]]:
+    """Buffer activity rows in the Redis stream for a later batched MySQL insert.
+
+    Returns the stream ids, or None when the backlog is full and the caller
+    should write to MySQL synchronously instead.
+    """
+    redis = get_redis()
+    if redis.xlen(STREAM_KEY) + len(activities) > MAX_BACKLOG:
+        logger.warning("Write-behind backlog full, falling back to synchronous writes")
+        return None
+
+    with redis.pipeline(transaction=False) as pipe:
+        for activity in activities:
+            pipe.xadd(STREAM_KEY, {
+                "user_id": activity["user_id"],
+                "calories_burned": activity["calories_burned"],
+                "activity_type": activity.get("activity_type") or "",
+                "timestamp": (activity.get("timestamp") or datetime.now()).isoformat()
+            })
+        return pipe.execute()
+
+class WriteBehindFlusher(threading.Thread):
+    """Background thread that drains the activity stream into MySQL in batches.
+
+    Entries are read through a consumer group and only acknowledged (and
+    deleted) after their batch commits. Each flush holds FLUSH_LOCK_KEY, so
+    a leaderboard rebuild can stop rows from landing while it reads MySQL. After a crash, the entries this
+    consumer had read are replayed on startup, and entries left behind by any
+    other consumer are claimed once idle. Rows carry their stream id in a
+    unique column, so a replayed batch is never inserted twice. If MySQL
+    rejects a batch, its rows are retried one by one; rows that still fail
+    go to the dead-letter stream, so one bad row cannot stall the rest.
+    """
+
+    def __init__(self, batch_size: int = None, block_ms: int = None, claim_idle_ms: int = None):
+        super().__init__(name="leaderboard-write-behind", daemon=True)
+        self.batch_size = batch_size or int(os.environ.get("LEADERBOARD_WRITE_BEHIND_BATCH_SIZE", 500))
+        self.block_ms = block_ms or int(os.environ.get("LEADERBOARD_WRITE_BEHIND_BLOCK_MS", 1000))
+        self.claim_idle_ms = claim_idle_ms or int(os.environ.get("LEADERBOARD_WRITE_BEHIND_CLAIM_IDLE_MS", 60000))
+        self.consumer = os.environ.get("LEADERBOARD_WRITE_BEHIND_CONSUMER", socket.gethostname())
+        self.flushed_total = 0
+        self.dead_lettered_total = 0
+        self.last_flush_at = None
+        self.last_error = None
+        self._last_claim = 0.0
+        self._replaying = True
+        self._stopped = threading.Event()
+
+    def run(self):
+        logger.info(f"Write-behind flusher started as consumer {self.consumer}")
+        while not self._stopped.is_set():
+            try:
+                self.ensure_group()
+                entries = self.next_batch()
+                if entries:
+                    self.flush(entries)
+            except Exception as e:
+                self.last_error = str(e)
+                logger.error(f"Write-behind flush failed: {str(e)}")
+                self._stopped.wait(5)
+
+    def stop(self):
+        self._stopped.set()
+
+    def ensure_group(self):
+        try:
+            get_redis().xgroup_create(STREAM_KEY, GROUP, id="0", mkstream=True)
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    def next_batch(self):
+        redis = get_redis()
+
+        # Entries delivered to this consumer before a restart come first
+        if self._replaying:
+            response = redis.xreadgroup(GROUP, self.consumer, {STREAM_KEY: "0"}, count=self.batch_size)
+            entries = response[0][1] if response else []
+            if entries:
+                return entries
+            self._replaying = False
+
+        # Then anything another consumer read but never acknowledged
+        if time.monotonic() - self._last_claim > self.claim_idle_ms / 1000:
+            self._last_claim = time.monotonic()
+            claimed = redis.xautoclaim(
+                STREAM_KEY, GROUP, self.consumer,
+                min_idle_time=self.claim_idle_ms, start_id="0-0", count=self.batch_size
+            )
+            if claimed[1]:
+                return claimed[1]
+
+        response = redis.xreadgroup(
+            GROUP, self.consumer, {STREAM_KEY: ">"},
+            count=self.batch_size, block=self.block_ms
+        )
+        return response[0][1] if response else []
+
+    def flush(self, entries):
+        rows = []
+        ids = []
+        dead = {}
+        fields_by_id = dict(entries)
+        for stream_id, fields in entries:
+            ids.append(stream_id)
+            try:
+                rows.append(parse_entry(stream_id, fields))
+            except (KeyError, TypeError, ValueError) as e:
+                dead[stream_id] = str(e)
+
+        with flush_lock():
+            with app.app_context():
+                dead.update(self.insert_rows(rows))
+
+            with get_redis().pipeline(transaction=True) as pipe:
+                for stream_id, error in dead.items():
+                    logger.error(f"Moving write-behind entry {stream_id} to the dead-letter stream: {error}")
+                    pipe.xadd(DEAD_LETTER_KEY, {**fields_by_id[stream_id], "stream_id": stream_id, "error": error},
+                              maxlen=MAX_BACKLOG, approximate=True)
+                pipe.xack(STREAM_KEY, GROUP, *ids)
+                pipe.xdel(STREAM_KEY, *ids)
+                pipe.execute()
+
+        flushed = len(ids) - len(dead)
+        self.flushed_total += flushed
+        self.dead_lettered_total += len(dead)
+        self.last_flush_at = datetime.now()
+        self.last_error = None
+        logger.info(f"Flushed {flushed} buffered activities to MySQL")
+
+    def insert_rows(self, rows):
+        """Insert a batch, retrying row by row if MySQL rejects it.
+
+        Returns {stream_id: error} for the rows that still fail. Connection
+        errors are raised instead, so the whole batch is retried later.
+        """
+        try:
+            add_activities(rows, ignore_duplicates=True)
+            return {}
+        except (InterfaceError, OperationalError):
+            raise
+        except Exception as e:
+            logger.warning(f"Batch insert of {len(rows)} buffered activities failed, retrying one by one: {str(e)}")
+
+        rejected = {}
+        for row in rows:
+            try:
+                add_activities([row], ignore_duplicates=True)
+            except (InterfaceError, OperationalError):
+                raise
+            except Exception as e:
+                rejected[row["stream_id"]] = str(e)
+        return rejected
+
+    def stats(self):
+        """Backlog size and flush lag: the age of the oldest entry not yet in MySQL."""
+        redis = get_redis()
+        with redis.pipeline(transaction=False) as pipe:
+            pipe.xlen(STREAM_KEY)
+            pipe.xrange(STREAM_KEY, count=1)
+            pipe.xlen(DEAD_LETTER_KEY)
+            backlog, oldest, dead_letters = pipe.execute()
+
+        lag_seconds = 0.0
+        if oldest:
+            enqueued_ms = int(oldest[0][0].split("-")[0])
+            lag_seconds = max(time.time() - enqueued_ms / 1000, 0.0)
+
+        return {
+            "enabled": WRITE_BEHIND_ENABLED,
+            "running": self.is_alive(),
+            "backlog": backlog,
+            "max_backlog": MAX_BACKLOG,
+            "flush_lag_seconds": round(lag_seconds, 3),
+            "flushed_total": self.flushed_total,
+            "dead_letters": dead_letters,
+            "dead_lettered_total": self.dead_lettered_total,
+            "last_flush_at": self.last_flush_at.isoformat() if self.last_flush_at else None,
+            "last_error": self.last_error
+        }
@@ -0,0 +1,154 @@
+import os
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from redis import Redis, ConnectionPool
+
+logger = logging.getLogger(__name__)
+
+PROFILE_CACHE_ENABLED = os.environ.get('PROFILE_CACHE', 'true').lower() == 'true'
+PROFILE_CACHE_TTL = int(os.environ.get('PROFILE_CACHE_TTL', 60 * 60))  # 1 hour in Redis
+PROFILE_LRU_SIZE = int(os.environ.get('PROFILE_LRU_SIZE', 10000))
+PROFILE_LRU_TTL = float(os.environ.get('PROFILE_LRU_TTL', 30))  # bounds staleness in other processes
+
+_pool = None
+_pool_lock = threading.Lock()
+
+# Stores a profile read from MySQL, unless it was invalidated (generation
+# bumped) after the read started.
+#   KEYS: profile key, generation key
+#   ARGV: generation seen before the read, TTL, profile JSON
+POPULATE_SCRIPT = """
+if (redis.call('GET', KEYS[2]) or '0') ~= ARGV[1] then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[3], 'EX', ARGV[2])
+return 1
+"""
+
+def get_pool():
+    """Get the process-wide Redis connection pool, creating it on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    host=os.environ.get('REDIS_HOST', 'localhost'),
+                    port=int(os.environ.get('REDIS_PORT', 6379)),
+                    password=os.environ.get('REDIS_PASSWORD', ''),
+                    max_connections=int(os.environ.get('REDIS_MAX_CONNECTIONS', 50)),
+                    socket_timeout=float(os.environ.get('REDIS_SOCKET_TIMEOUT', 0.5)),
+                    socket_connect_timeout=float(os.environ.get('REDIS_SOCKET_TIMEOUT', 0.5)),
+                    decode_responses=True
+                )
+    return _pool
+
+def get_redis():
+    return Redis(connection_pool=get_pool())
+
+class ProfileCache:
+    """Two-tier cache of public user profiles (never the password hash).
+
+    Reads try a small in-process LRU, then Redis, then MySQL. Writes to a
+    user invalidate both tiers; other processes' LRU entries expire within
+    PROFILE_LRU_TTL seconds. Redis errors fall back to MySQL.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._lru = OrderedDict()
+        self._populate = None
+        self.lru_hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    @staticmethod
+    def profile_key(user_id):
+        return f"user:profile:{user_id}"
+
+    @staticmethod
+    def generation_key(user_id):
+        return f"user:profile:gen:{user_id}"
+
+    def get(self, user_id, load):
+        """Get a user's profile dict, or None. load() reads it from MySQL on a miss."""
+        with self._lock:
+            entry = self._lru.get(user_id)
+            if entry and entry[0] > time.monotonic():
+                self._lru.move_to_end(user_id)
+                self.lru_hits += 1
+                return entry[1]
+
+        generation = None
+        try:
+            with get_redis().pipeline(transaction=False) as pipe:
+                pipe.get(self.profile_key(user_id))
+                pipe.get(self.generation_key(user_id))
+                cached, generation = pipe.execute()
+            if cached:
+                profile = json.loads(cached)
+                self._remember(user_id, profile)
+                with self._lock:
+                    self.redis_hits += 1
+                return profile
+        except Exception as e:
+            self._record_error(e)
+
+        profile = load()
+        with self._lock:
+            self.misses += 1
+        if profile is not None:
+            self._remember(user_id, profile)
+            try:
+                if self._populate is None:
+                    self._populate = get_redis().register_script(POPULATE_SCRIPT)
+                self._populate(
+                    keys=[self.profile_key(user_id), self.generation_key(user_id)],
+                    args=[generation or '0', PROFILE_CACHE_TTL, json.dumps(profile)]
+                )
+            except Exception as e:
+                self._record_error(e)
+        return profile
+
+    def invalidate(self, user_id):
+        """Drop a user's cached profile after it was updated or deleted."""
+        with self._lock:
+            self._lru.pop(user_id, None)
+        try:
+            with get_redis().pipeline(transaction=True) as pipe:
+                pipe.incr(self.generation_key(user_id))
+                pipe.expire(self.generation_key(user_id), PROFILE_CACHE_TTL)
+                pipe.delete(self.profile_key(user_id))
+                pipe.execute()
+        except Exception as e:
+            self._record_error(e)
+
+    def stats(self):
+        with self._lock:
+            hits = self.lru_hits + self.redis_hits
+            lookups = hits + self.misses
+            return {
+                "enabled": PROFILE_CACHE_ENABLED,
+                "lru_size": len(self._lru),
+                "lru_hits": self.lru_hits,
+                "redis_hits": self.redis_hits,
+                "misses": self.misses,
+                "errors": self.errors,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0
+            }
+
+    def _remember(self, user_id, profile):
+        with self._lock:
+            self._lru[user_id] = (time.monotonic() + PROFILE_LRU_TTL, profile)
+            self._lru.move_to_end(user_id)
+            while len(self._lru) > PROFILE_LRU_SIZE:
+                self._lru.popitem(last=False)
+
+    def _record_error(self, error):
+        logger.warning(f"Profile cache unavailable: {str(error)}")
+        with self._lock:
+            self.errors += 1
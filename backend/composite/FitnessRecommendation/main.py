@@ -14,12 +14,7 @@ CORS(app)
 
 USER_SERVICE_URL = os.getenv("USER_SERVICE_URL", "http://user-service:5000/user")
 ACTIVITY_LOG_URL = os.getenv("ACTIVITY_LOG_URL", "http://activitylog-service:5030/activity")
-
-
-def compute_average_intensity(activities):
-    intensity_scale = {"low": 1, "medium": 2, "high": 3}
-    total = sum(intensity_scale.get(a.get("intensity", "").lower(), 1) for a in activities)
-    return round(total / len(activities), 2) if activities else 0
+RECENT_ACTIVITY_LIMIT = int(os.getenv("RECENT_ACTIVITY_LIMIT", 20))
 
 
 def fetch_user_data(user_id):
@@ -42,49 +37,43 @@ def fetch_user_data(user_id):
 
 
 def fetch_activity_logs(user_id):
+    # Only the most recent page of history goes into the recommendation prompt
     try:
-        activity_resp = requests.get(f"{ACTIVITY_LOG_URL}/{user_id}")
+        activity_resp = requests.get(f"{ACTIVITY_LOG_URL}/{user_id}", params={"limit": RECENT_ACTIVITY_LIMIT})
         activity_resp.raise_for_status()
-        return activity_resp.json()
+        return activity_resp.json()["activities"]
     except requests.exceptions.RequestException as e:
         print(f"Failed to fetch activity log: {str(e)}")
         raise Exception(f"Failed to fetch activity log: {str(e)}")
 
 
-def filter_recent_activities(activity_log, time_str=None):
+def get_summary_window(time_str=None):
     if time_str:
         try:
             target_time = datetime.fromisoformat(time_str)
         except ValueError:
             raise ValueError("Invalid time format. Use ISO format (e.g., 2023-04-15T14:30:00)")
         
-        # Filter activities based on the provided time
-        return [
-            a for a in activity_log
-            if abs((datetime.fromisoformat(a['timestamp']) - target_time).total_seconds()) < 86400  # Within 24 hours
-        ]
+        # Activities within 24 hours of the provided time
+        return target_time - timedelta(days=1), target_time + timedelta(days=1)
     else:
-        # Use default 7-day window
-        one_week_ago = datetime.now() - timedelta(days=7)
-        return [
-            a for a in activity_log
-            if datetime.fromisoformat(a['timestamp']) > one_week_ago
-        ]
+        # Use default 7-day window, from midnight so it is served from the daily rollup
+        today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        return today - timedelta(days=7), None
 
 
-def calculate_summary_stats(activities):
-    if activities:
-        return {
-            "total_sessions": len(activities),
-            "total_minutes": sum(a['duration'] for a in activities),
-            "avg_intensity": compute_average_intensity(activities)
-        }
-    else:
-        return {
-            "total_sessions": 0,
-            "total_minutes": 0,
-            "avg_intensity": 0
-        }
+def fetch_activity_summary(user_id, since, until=None):
+    # Aggregates are computed by the ActivityLog service, so only the totals cross the wire
+    params = {"since": since.isoformat()}
+    if until:
+        params["until"] = until.isoformat()
+    try:
+        summary_resp = requests.get(f"{ACTIVITY_LOG_URL}/{user_id}/summary", params=params)
+        summary_resp.raise_for_status()
+        return summary_resp.json()
+    except requests.exceptions.RequestException as e:
+        print(f"Failed to fetch activity summary: {str(e)}")
+        raise Exception(f"Failed to fetch activity summary: {str(e)}")
 
 
 @app.route('/health', methods=['GET'])
@@ -112,17 +101,17 @@ def recommend():
         if not weather:
             return jsonify({"error": f"Failed to fetch weather data for {location}"}), 500
 
-        # 3. Fetch activity log data based on user id
+        # 3. Fetch recent activity log data based on user id
         activity_log = fetch_activity_logs(user_id)
         
-        # 4. Filter recent activities
+        # 4. Work out the summary window
         try:
-            recent_activities = filter_recent_activities(activity_log, time_str)
+            since, until = get_summary_window(time_str)
         except ValueError as e:
             return jsonify({"error": str(e)}), 400
         
-        # 5. Calculate summary statistics
-        summary_stats = calculate_summary_stats(recent_activities)
+        # 5. Fetch summary statistics for the window
+        summary_stats = fetch_activity_summary(user_id, since, until)
        
         # 6. Generate recommendation using Groq via openai_client
         advice = get_recommendation(user_data, activity_log, weather, summary_stats)
@@ -1,4 +1,5 @@
 import os
+import json
 import requests
 from sendgrid import SendGridAPIClient
 from sendgrid.helpers.mail import Mail
@@ -18,35 +19,54 @@ CORS(app)
 USER_SERVICE_URL = os.getenv("USER_SERVICE_URL", "http://user-service:5000/user")
 ACTIVITYLOG_SERVICE_URL = os.getenv("ACTIVITY_SERVICE_URL", "http://activitylog:5030/activity")
 
+USER_PAGE_SIZE = int(os.getenv("USER_PAGE_SIZE", 500))
+
+def iter_users():
+    """Walk every user page by page, so memory stays bounded however many users there are."""
+    after = None
+    while True:
+        params = {"limit": USER_PAGE_SIZE}
+        if after:
+            params["after"] = after
+        users_resp = requests.get(USER_SERVICE_URL, params=params)
+        users_resp.raise_for_status()
+        page = users_resp.json().get("data", {})
+        yield from page.get("users", [])
+        after = page.get("next_cursor")
+        if not after:
+            return
+
 def monthly_report():
     try:
-        # Step 1: Get all users
-        users_resp = requests.get(USER_SERVICE_URL)
-        users_data = users_resp.json().get("data", {}).get("users", [])
+        # Step 1: Get every user's activity totals for the past month in one request,
+        # streamed back by ActivityLog one line per user (a whole-day window, so it
+        # is answered from the daily rollup)
+        one_month_ago = datetime.date.today() - datetime.timedelta(days=30)
+        monthly_totals = {}
+        with requests.get(
+            f"{ACTIVITYLOG_SERVICE_URL}/summary",
+            params={"users": "all", "since": one_month_ago.isoformat()},
+            stream=True
+        ) as summary_resp:
+            summary_resp.raise_for_status()
+            for line in summary_resp.iter_lines():
+                if line:
+                    totals = json.loads(line)
+                    monthly_totals[totals["userId"]] = totals
 
-        for user in users_data:
+        # Step 2: Walk all users one page at a time
+        for user in iter_users():
             user_id = user["userId"]
             name = user["name"]
             email = user["email"]
 
-            # Step 2: Get activity log for user
-            activity_resp = requests.get(f"{ACTIVITYLOG_SERVICE_URL}/{user_id}")
-            if activity_resp.status_code != 200:
+            summary = monthly_totals.get(str(user_id))
+            if summary is None:
                 print(f"No activity data for user: {user_id}")
                 continue
 
-            activities = activity_resp.json()
-            
-            # filter activities from the past month
-            now = datetime.datetime.now()
-            one_month_ago = now - datetime.timedelta(days=30)
-            recent_activities = [
-                a for a in activities
-                if datetime.datetime.fromisoformat(a["timestamp"]) > one_month_ago
-            ]
-
-            total_calories = sum(a["caloriesBurned"] for a in recent_activities)
-            total_duration = sum(a["duration"] for a in recent_activities)
+            total_calories = summary["total_calories"]
+            total_duration = summary["total_minutes"]
 
             # Step 3: Send email
             html_content = f"""